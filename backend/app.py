@@ -8,19 +8,23 @@ Description: This module serves as the backend, hosting the API server.
 It handles incoming requests for adding articles and prompts to the
 database.
 
-TODO: "The garbage collector for deleting articles >1000 is not implemented yet It should be triggered randomly during POST requests when adding new articles. Same for prompts based on last usage info.
+Old articles and idle prompts are removed by a background collector, see
+retention.py.
 """
 
 import os
 import secrets
 import sys
+import struct
 import uvicorn
 import numpy as np
 from typing import List, Dict, Optional
+from contextlib import asynccontextmanager
 import dotenv
 
-from fastapi import FastAPI, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi import Body, FastAPI, HTTPException, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict
 from sqlalchemy import (
     create_engine,
     Column,
@@ -31,11 +35,14 @@ from sqlalchemy import (
     JSON,
     or_,
     and_,
+    not_,
     func,
+    select,
+    update,
 )
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import declarative_base, load_only
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 
 
@@ -44,22 +51,77 @@ logging.basicConfig(
 )
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../common")))
-from models import Base, Prompt, RSSItem
+from models import Base, Prompt, RSSItem, Entity, EntityPosting
+import database
+from index import EmbeddingIndex
+import entities
+import feeds
+import migrations
+from retention import RetentionCollector
+import events
 import utils
+import vectors
+from image_store import ImageStore, check_image, default_root, is_digest
 
 # Create DB files and tables
 db_path = os.getenv("LNQ_DB_PATH", os.path.join(os.getcwd(), "db/news.db"))
 os.makedirs(os.path.dirname(db_path), exist_ok=True)
 if not os.path.exists(db_path):
     open(db_path, "w").close()
-DATABASE_URL = f"sqlite:///{db_path}"
-engine = create_engine(DATABASE_URL, echo=True)
+engine = database.create_sqlite_engine(db_path)
 Session = sessionmaker(bind=engine)
 Base.metadata.create_all(bind=engine)
+migrations.run(engine)
+image_store = ImageStore(default_root(db_path))
+
+# Maximum number of articles returned by a search
+LNQ_SEARCH_TOP_K = int(os.getenv("LNQ_SEARCH_TOP_K", "1000"))
+# Minimum score (similarity + NER overlap) for an article to match a prompt
+SEARCH_THRESHOLD = 0.9
+# Rows read per query by the bulk endpoint
+LNQ_BULK_BATCH_SIZE = int(os.getenv("LNQ_BULK_BATCH_SIZE", "500"))
+# How long a NER worker holds the items it claims
+LNQ_NER_LEASE_SECONDS = int(os.getenv("LNQ_NER_LEASE_SECONDS", "300"))
+# Article fields shown on the frontend listings: changing them invalidates
+# the cached pages (see database.bump_data_version)
+LISTED_FIELDS = ("image", "similar")
+# Fields the clients can write (PUT or PATCH)
+RSS_ITEM_WRITABLE = ("tags", "embedding", "ogp", "similar", "ner_count", "image")
+PROMPT_WRITABLE = ("text", "settings", "tags", "embedding", "feed", "ner_count")
+# Articles older than this drop out of the prompt feeds
+LNQ_FEED_MAX_AGE_HOURS = int(os.getenv("LNQ_FEED_MAX_AGE_HOURS", "48"))
+# Articles embedded up to this long before a prompt's watermark are scored
+# again, so that a write racing a refresh is never missed.
+FEED_WATERMARK_MARGIN = timedelta(seconds=60)
+# A prompt whose feed did not change keeps its watermark up to this long
+# (seconds), so a refresh only writes the prompts it changed
+LNQ_FEED_WATERMARK_LAG = int(os.getenv("LNQ_FEED_WATERMARK_LAG", "600"))
+
+# Resident index of article embeddings, shared by all requests
+embedding_index = EmbeddingIndex()
+event_bus = events.EventBus()
+retention = RetentionCollector(Session, embedding_index, image_store)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db = Session()
+    try:
+        embedding_index.load(
+            db.query(RSSItem.uuid, RSSItem.embedding, RSSItem.embedded_at, RSSItem.pubDate)
+            .filter(RSSItem.embedding.isnot(None))
+            .yield_per(500),
+            db.query(EntityPosting.article_uuid, EntityPosting.entity_id).yield_per(5000),
+        )
+    finally:
+        db.close()
+    retention.start()
+    yield
+    retention.stop()
 
 
 # FastAPI app instance
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 # Prompt Pydantic models
@@ -70,6 +132,9 @@ class PromptCreate(BaseModel):
 
 
 class PromptResponse(PromptCreate):
+    # Embeddings are binary blobs, sent as base64 strings
+    model_config = ConfigDict(ser_json_bytes="base64")
+
     uuid: str
     text: str
     text_improved: Optional[str]
@@ -77,13 +142,21 @@ class PromptResponse(PromptCreate):
     tags:  Optional[list]
     created_at: Optional[datetime]
     lastused_at: Optional[datetime]
-    embedding: Optional[list]
-    feed: Optional[list]
+    embedding: Optional[bytes]
+    # Read from the prompt_feed table (see prompt_response)
+    feed: Optional[list] = []
     settings: Optional[list]
     ner_count: Optional[int]
     enable: Optional[bool]
 
 
+def prompt_response(db, db_prompt):
+    """PromptResponse of a prompt, with its feed."""
+    response = PromptResponse.model_validate(db_prompt, from_attributes=True)
+    response.feed = feeds.entries(db, db_prompt.uuid)
+    return response
+
+
 # RSSItem Pydantic models
 class RSSItemCreate(BaseModel):
     link: str
@@ -97,8 +170,46 @@ class RSSItemCreate(BaseModel):
 
 
 class RSSItemResponse(RSSItemCreate):
+    model_config = ConfigDict(ser_json_bytes="base64")
+
     uuid: str
     ner_count: int
+    embedding: Optional[bytes] = None
+
+
+class RSSItemBatchResult(BaseModel):
+    link: str
+    uuid: str
+    status: str
+
+
+def parse_fields(fields, response_model):
+    """
+    Field names of a ?fields=uuid,title parameter, or None for every field.
+    Unknown names are rejected with a 400.
+    """
+    if not fields:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in response_model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def partial_response(response_model, values):
+    """JSON response with only some fields of a response model (serialized like the full model)."""
+    return JSONResponse(
+        response_model.model_construct(**values).model_dump(mode="json", include=set(values))
+    )
+
+
+def parse_embedding(value):
+    """Decode an embedding from a request body, rejecting malformed blobs."""
+    try:
+        return vectors.from_api(value)
+    except (ValueError, TypeError, struct.error) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid embedding: {e}")
 
 
 # Dependency to get the database session
@@ -110,42 +221,110 @@ def get_db():
         db.close()
 
 
-# Returns all items in the database that have tags AND embeddings
-@app.get("/all/{type}")
-def get_all(type: str, db: Session = Depends(get_db)):
+def all_query(type: str):
+    """Model, filter and order of the items that have tags or embeddings."""
     if type == "articles":
-        items = (
-            db.query(RSSItem)
-            .filter(
-                or_(
-                    RSSItem.tags != "[]",
-                    RSSItem.embedding != "[]",
-                )
-            )
-            .order_by(RSSItem.pubDate.asc()) #return older first
-            .all()
+        model = RSSItem
+        condition = or_(
+            RSSItem.tags != "[]",
+            RSSItem.embedding.isnot(None),
         )
+        order = RSSItem.pubDate.asc()  # return older first
     elif type == "prompts":
-        items = (
-            db.query(Prompt)
-            .filter(
-                or_(
-                    Prompt.tags != "[]",
-                    Prompt.embedding != "[]",
-                )
-            )
-            .order_by(Prompt.created_at.desc())  #return recent first
-            .all()
+        model = Prompt
+        condition = or_(
+            Prompt.tags != "[]",
+            Prompt.embedding.isnot(None),
         )
+        order = Prompt.created_at.desc()  # return recent first
     else:
         raise HTTPException(
             status_code=400, detail="Invalid type. Use 'articles' or 'prompts'."
         )
+    return model, condition, order
+
 
+# Returns all items in the database that have tags AND embeddings
+@app.get("/all/{type}")
+def get_all(type: str, db: Session = Depends(get_db)):
+    model, condition, order = all_query(type)
+    items = db.query(model.uuid).filter(condition).order_by(order).all()
     uuids = [item.uuid for item in items]
     return uuids
 
 
+class BulkRequest(BaseModel):
+    # Items to return, in this order; all the items of /all/{type} when omitted
+    uuids: Optional[List[str]] = None
+
+
+@app.post("/bulk/{type}")
+def get_bulk(type: str, request: BulkRequest, fields: Optional[str] = None):
+    """
+    Many articles or prompts in one request, streamed as NDJSON: one JSON
+    object per line, serialized like GET /rss-item/{uuid} or
+    GET /prompt/{uuid}. Rows are read LNQ_BULK_BATCH_SIZE at a time, so memory
+    stays flat whatever the number of items. Unknown uuids are skipped.
+    Args:
+        type: 'articles' or 'prompts'.
+        request: {"uuids": [...]}, or {} for every item of /all/{type}.
+        fields: Optional ?fields=uuid,title selection.
+    """
+    model, condition, order = all_query(type)
+    response_model = RSSItemResponse if model is RSSItem else PromptResponse
+    names = parse_fields(fields, response_model) or list(response_model.model_fields)
+    columns = [getattr(model, name) for name in names if name != "feed"]
+
+    def lines():
+        # The request's own session: the response outlives the endpoint
+        db = Session()
+        try:
+            if request.uuids is None:
+                uuids = [
+                    uuid for (uuid,) in db.query(model.uuid).filter(condition).order_by(order)
+                ]
+            else:
+                uuids = list(dict.fromkeys(request.uuids))
+            for start in range(0, len(uuids), LNQ_BULK_BATCH_SIZE):
+                batch = uuids[start : start + LNQ_BULK_BATCH_SIZE]
+                rows = {
+                    item.uuid: item
+                    for item in db.query(model)
+                    .options(load_only(*columns or [model.uuid]))
+                    .filter(model.uuid.in_(batch))
+                }
+                entries = feeds.entries_many(db, list(rows)) if "feed" in names else {}
+                for uuid in batch:
+                    if uuid not in rows:
+                        continue
+                    values = {
+                        name: entries.get(uuid, []) if name == "feed" else getattr(rows[uuid], name)
+                        for name in names
+                    }
+                    yield response_model.model_construct(**values).model_dump_json(
+                        include=set(names)
+                    ) + "\n"
+                db.expunge_all()
+        finally:
+            db.close()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/links")
+def get_links(hours: int = 48, db: Session = Depends(get_db)):
+    """
+    Links of the articles published in the last hours.
+    Used by feedparser to warm its cache of already posted links.
+
+    Returns:
+        List of {"link", "pubDate"}.
+    """
+    since = datetime.utcnow() - timedelta(hours=hours)
+    items = db.query(RSSItem.link, RSSItem.pubDate).filter(RSSItem.pubDate >= since).all()
+    return [{"link": item.link, "pubDate": item.pubDate} for item in items]
+
+
 @app.get("/search/{uuid}")
 def search(uuid: str, db: Session = Depends(get_db)):
     """
@@ -160,7 +339,7 @@ def search(uuid: str, db: Session = Depends(get_db)):
         db.query(Prompt)
         .filter(
             Prompt.uuid == uuid,
-            Prompt.embedding != [],
+            Prompt.embedding.isnot(None),
         )
         .first()
     )
@@ -168,84 +347,267 @@ def search(uuid: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Prompt not found")
 
     #TO DO: Ajouter filtre sur setttings
-    items = db.query(RSSItem).filter(RSSItem.embedding != "[]").order_by(RSSItem.pubDate.desc()).all()
-    result = []
-    score_1 = 0
-    score_2 = 0
-    for item in items:
-        logging.info(f"Search score for article: {item.uuid}")
-        if item.embedding and item.embedding != "[]":
-            score_1 = utils.calculate_similarity(item.embedding, db_item.embedding)
-
-        if item.tags and item.tags != "[]" and db_item.tags and db_item.tags != "[]":
-            score_2 = utils.calculate_ner(item.tags, db_item.tags)
-
-        total = score_1 + score_2
-        if total > 0.9:
-            result.append(
-                {
-                    "uuid": item.uuid,
-                    "score": total
-                }
-            )
-    return result
+    return embedding_index.search(
+        db_item.embedding,
+        entities.lookup(db, db_item.tags),
+        threshold=SEARCH_THRESHOLD,
+        k=LNQ_SEARCH_TOP_K,
+    )
 
 
-@app.get("/ner/{type}")
-def get_items_for_ner(type: str, db: Session = Depends(get_db)):
+@app.post("/feeds/refresh")
+def refresh_feeds(db: Session = Depends(get_db)):
+    """
+    Update the feed of every active prompt.
+    Each prompt keeps a watermark (scored_at): only articles embedded since
+    then are scored, in one batch for all prompts. Only the feed rows of
+    those articles are read, expired rows are deleted by date, and only the
+    changed prompt_feed rows and prompts are written, in a single transaction.
+
+    Returns:
+        The number of prompts refreshed.
+    """
+    now = datetime.utcnow()
+    not_before = now - timedelta(hours=LNQ_FEED_MAX_AGE_HOURS)
+    prompts = (
+        db.query(Prompt)
+        .options(load_only(Prompt.uuid, Prompt.tags, Prompt.embedding, Prompt.scored_at))
+        .filter(
+            Prompt.embedding.isnot(None),
+            or_(Prompt.enable.is_(None), Prompt.enable == True),
+        )
+        .all()
+    )
+    since = [
+        prompt.scored_at - FEED_WATERMARK_MARGIN if prompt.scored_at else None
+        for prompt in prompts
+    ]
+    hits, rescored = embedding_index.search_since(
+        [prompt.embedding for prompt in prompts],
+        entities.lookup_many(db, [prompt.tags for prompt in prompts]),
+        threshold=SEARCH_THRESHOLD,
+        k=LNQ_SEARCH_TOP_K,
+        since=since,
+        not_before=not_before,
+    )
+    # The articles scored again can enter, move in or leave a feed; the
+    # other rows are untouched
+    stored = feeds.load_articles(db, set().union(*(uuids for uuids in rescored if uuids)))
+    changed = feeds.remove_expired(db, [prompt.uuid for prompt in prompts], not_before)
+    stale = now - timedelta(seconds=LNQ_FEED_WATERMARK_LAG)
+    for prompt, uuids, new in zip(prompts, rescored, hits):
+        old = feeds.load(db, prompt.uuid) if uuids is None else stored.get(prompt.uuid, {})
+        if uuids is not None:
+            old = {uuid: score for uuid, score in old.items() if uuid in uuids}
+        if feeds.save(db, prompt.uuid, old, new):
+            feeds.trim(db, prompt.uuid, LNQ_SEARCH_TOP_K)
+            changed.add(prompt.uuid)
+        if prompt.uuid in changed or prompt.scored_at is None or prompt.scored_at < stale:
+            prompt.scored_at = now
+    if changed:
+        database.bump_data_version(db)
+    db.commit()
+    return {"prompts": len(prompts)}
+
+
+@app.get("/events")
+async def get_events(
+    since: Optional[int] = None,
+    epoch: Optional[str] = None,
+    types: Optional[str] = None,
+    timeout: float = 25.0,
+):
+    """
+    Long-poll the change events after the sequence number `since`.
+    Without `since`, returns the current sequence number right away; with
+    an `epoch` other than the backend's (it restarted), returns a reset
+    right away.
+    Returns:
+        {"epoch", "seq", "events", "reset"}: resume from `epoch` and `seq`;
+        when `reset` is true events were missed and the worker should poll
+        for work.
+    """
+    if since is None:
+        return {"epoch": event_bus.epoch, "seq": event_bus.seq, "events": [], "reset": False}
+    if epoch is not None and epoch != event_bus.epoch:
+        return {"epoch": event_bus.epoch, "seq": event_bus.seq, "events": [], "reset": True}
+    wanted = set(types.split(",")) if types else None
+    found, last, reset = await event_bus.wait(since, wanted, min(max(timeout, 0.0), 60.0))
+    return {"epoch": event_bus.epoch, "seq": last, "events": found, "reset": reset}
+
+
+@app.get("/images/{digest}")
+def get_image(digest: str):
+    """Tell whether every variant of an image is already stored."""
+    if not is_digest(digest) or not image_store.complete(digest):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return {"digest": digest}
+
+
+@app.put("/images/{digest}/{variant}.{ext}", status_code=201)
+def put_image(
+    digest: str,
+    variant: str,
+    ext: str,
+    data: bytes = Body(b"", media_type="application/octet-stream"),
+):
+    """
+    Store a rendered image variant in the content-addressed image store.
+    The body must be a whole image of the declared format. A stored file
+    is only replaced while the image is incomplete and the file is not a
+    whole image, so a valid variant can never be overwritten. A plain
+    (threaded) handler: file writes never block the event loop.
+    """
+    if not data:
+        raise HTTPException(status_code=422, detail="Empty image")
+    try:
+        check_image(data, ext)
+        image_store.put(data, digest, variant, ext, repair=not image_store.complete(digest))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"digest": digest}
+
+
+@app.get("/entity/{name}")
+def get_entity_articles(name: str, db: Session = Depends(get_db)):
+    """
+    Articles mentioning an entity.
+    Args:
+        name: The entity, normalized like NER tags (case and accents folded).
+
+    Returns:
+        The list of article uuids, most recent first.
+    """
+    items = (
+        db.query(RSSItem.uuid)
+        .join(EntityPosting, EntityPosting.article_uuid == RSSItem.uuid)
+        .join(Entity, Entity.id == EntityPosting.entity_id)
+        .filter(Entity.name == utils.normalize_entity(name))
+        .order_by(RSSItem.pubDate.desc())
+        .all()
+    )
+    return [item.uuid for item in items]
+
+
+NER_STAGES = ("ner", "enrich")
+
+
+def ner_queue(type: str, now: datetime, stage: Optional[str] = None):
+    """
+    Model, filter and order of the items waiting for NER work (and not leased).
+    Args:
+        stage: "ner" for the articles missing their tags or embedding,
+            "enrich" for those only missing their OGP, None for both.
+    """
+    if stage is not None and stage not in NER_STAGES:
+        raise HTTPException(
+            status_code=400, detail="Invalid stage. Use 'ner' or 'enrich'."
+        )
     if type == "articles":
-        items = (
-            db.query(RSSItem)
-            .filter(
-                and_(
-                    or_(
-                        RSSItem.tags == "[]",
-                        RSSItem.embedding == "[]",
-                        RSSItem.ogp == "",
-                        RSSItem.ogp == "[]",
-                        RSSItem.ogp == '[{"title": "", "basic": [], "open_graph": [], "twitter": [], "other": []}]',
-                    ),
-                    # Max retry per item is 3
-                    RSSItem.ner_count <= 3,
-                )
-            )
-            .order_by(RSSItem.pubDate.asc())
-            .limit(10)
-            .all()
+        model = RSSItem
+        analysis = or_(RSSItem.tags == "[]", RSSItem.embedding.is_(None))
+        enrichment = or_(
+            RSSItem.ogp == "",
+            RSSItem.ogp == "[]",
+            RSSItem.ogp == '[{"title": "", "basic": [], "open_graph": [], "twitter": [], "other": []}]',
         )
+        if stage == "ner":
+            pending = analysis
+        elif stage == "enrich":
+            pending = and_(enrichment, not_(analysis))
+        else:
+            pending = or_(analysis, enrichment)
+        order = RSSItem.pubDate.asc()  # return older first
     elif type == "prompts":
-        items = (
-            db.query(Prompt)
-            .filter(
-                and_(
-                    or_(
-                        Prompt.tags == "[]",
-                        Prompt.embedding == "[]",
-                    ),
-                    # Max retry per item is 3
-                    Prompt.ner_count <= 3,
-                )
-            )
-            .order_by(Prompt.created_at.asc())
-            .limit(10)
-            .all()
+        if stage == "enrich":
+            raise HTTPException(status_code=400, detail="Prompts are not enriched.")
+        model = Prompt
+        pending = or_(
+            Prompt.tags == "[]",
+            Prompt.embedding.is_(None),
         )
+        order = Prompt.created_at.asc()
     else:
         raise HTTPException(
             status_code=400, detail="Invalid type. Use 'articles' or 'prompts'."
         )
+    condition = and_(
+        pending,
+        # Max retry per item is 3
+        model.ner_count <= 3,
+        # Items leased to a worker come back once the lease expires
+        or_(model.lease_until.is_(None), model.lease_until < now),
+    )
+    return model, condition, order
 
-    uuids = [item.uuid for item in items]
-    return uuids
+
+@app.get("/ner/{type}")
+def get_items_for_ner(type: str, db: Session = Depends(get_db)):
+    model, condition, order = ner_queue(type, datetime.utcnow())
+    items = db.query(model.uuid).filter(condition).order_by(order).limit(10).all()
+    return [item.uuid for item in items]
+
+
+@app.post("/ner/{type}/claim")
+def claim_items_for_ner(
+    type: str,
+    worker: str,
+    limit: int = 10,
+    lease: int = LNQ_NER_LEASE_SECONDS,
+    stage: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Lease a batch of items waiting for NER work to a worker.
+    The rows are selected and leased by a single UPDATE, so two workers
+    never get the same item. A lease is released by the PUT that sets
+    ner_count, or expires after `lease` seconds (the item is then handed to
+    the next claim). ?stage=ner or ?stage=enrich only claims the articles
+    needing that stage (see ner_queue).
+    """
+    now = datetime.utcnow()
+    model, condition, order = ner_queue(type, now, stage)
+    until = now + timedelta(seconds=max(1, lease))
+    candidates = (
+        select(model.uuid).where(condition).order_by(order).limit(max(0, min(limit, 100)))
+    )
+    db.execute(
+        update(model)
+        .where(model.uuid.in_(candidates))
+        .values(leased_by=worker, lease_until=until)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    items = (
+        db.query(model.uuid)
+        .filter(model.leased_by == worker, model.lease_until == until)
+        .order_by(order)
+        .all()
+    )
+    return [item.uuid for item in items]
 
 
 # API Endpoints for Prompt (query)
 @app.get("/prompt/{uuid}", response_model=PromptResponse)
-def get_prompt(uuid: str, db: Session = Depends(get_db)):
-    db_prompt = db.query(Prompt).filter(Prompt.uuid == uuid).first()
+def get_prompt(uuid: str, fields: Optional[str] = None, db: Session = Depends(get_db)):
+    """A prompt; ?fields=uuid,text returns (and reads) only those fields."""
+    names = parse_fields(fields, PromptResponse)
+    query = db.query(Prompt).filter(Prompt.uuid == uuid)
+    if names is not None:
+        columns = [getattr(Prompt, name) for name in names if name != "feed"]
+        query = query.options(load_only(*columns or [Prompt.uuid]))
+    db_prompt = query.first()
     if db_prompt is None:
         raise HTTPException(status_code=404, detail="Prompt not found")
-    return db_prompt
+    if names is None:
+        return prompt_response(db, db_prompt)
+    return partial_response(
+        PromptResponse,
+        {
+            name: feeds.entries(db, uuid) if name == "feed" else getattr(db_prompt, name)
+            for name in names
+        },
+    )
 
 
 @app.post("/prompt/", response_model=PromptResponse)
@@ -257,24 +619,37 @@ def create_prompt(prompt: PromptCreate, db: Session = Depends(get_db)):
         settings=prompt.settings
     )
     db.add(db_prompt)
+    database.bump_data_version(db)
     db.commit()
     db.refresh(db_prompt)
+    event_bus.publish(events.PROMPT_CHANGED, db_prompt.uuid)
     return db_prompt
 
 
-@app.put("/prompt/{uuid}/{key}", response_model=PromptResponse)
-def update_prompt(uuid: str, key:str, data: dict, db: Session = Depends(get_db)):
-    db_prompt = db.query(Prompt).filter(and_(Prompt.uuid == uuid, Prompt.key == key)).first()
+def write_prompt(db, uuid, key, data, partial=False):
+    """
+    Apply an update to a prompt and commit.
+    Args:
+        data: The fields to write; see PROMPT_WRITABLE, other keys are ignored.
+        partial: Only load the primary key instead of the whole row.
+    """
+    query = db.query(Prompt).filter(and_(Prompt.uuid == uuid, Prompt.key == key))
+    if partial:
+        query = query.options(load_only(Prompt.uuid))
+    db_prompt = query.first()
     if not db_prompt:
         raise HTTPException(status_code=404, detail="Prompt not found")
+    if any(field in data for field in ("text", "settings", "tags", "embedding")):
+        # The feed must be scored again against every article
+        db_prompt.scored_at = None
     if "text" in data:
         db_prompt.text = data["text"]
         # Modifier prompt.text impose une réinitialisation des
         # colonnes ci-dessous.
         db_prompt.text_improved = ""
         db_prompt.tags = []
-        db_prompt.embedding = []
-        db_prompt.feed = []
+        db_prompt.embedding = None
+        feeds.clear(db, [db_prompt.uuid])
         db_prompt.ner_count = 0
     if "settings" in data:
         # Modifier prompt.settings ne nécessite pas de réinitialisation,
@@ -283,70 +658,206 @@ def update_prompt(uuid: str, key:str, data: dict, db: Session = Depends(get_db))
     if "tags" in data:
         db_prompt.tags = data["tags"]
     if "embedding" in data:
-        db_prompt.embedding = data["embedding"]
+        db_prompt.embedding = parse_embedding(data["embedding"])
     if "feed" in data:
-        db_prompt.feed = data["feed"]
+        feeds.save(db, db_prompt.uuid, feeds.load(db, db_prompt.uuid), data["feed"])
     if "ner_count" in data:
         db_prompt.ner_count = data["ner_count"]
+        # The NER worker is done with the prompt
+        db_prompt.leased_by = None
+        db_prompt.lease_until = None
+    if any(field in data for field in ("text", "feed")):
+        database.bump_data_version(db)
     db.commit()
-    db.refresh(db_prompt)
+    event_bus.publish(events.PROMPT_CHANGED, uuid)
     return db_prompt
 
 
+@app.put("/prompt/{uuid}/{key}", response_model=PromptResponse)
+def update_prompt(uuid: str, key:str, data: dict, db: Session = Depends(get_db)):
+    db_prompt = write_prompt(db, uuid, key, data)
+    db.refresh(db_prompt)
+    return prompt_response(db, db_prompt)
+
+
+@app.patch("/prompt/{uuid}/{key}")
+def patch_prompt(uuid: str, key: str, data: dict, db: Session = Depends(get_db)):
+    """
+    Update only the given fields of a prompt (see PromptClient.update).
+    The row is not read back: returns {"uuid", "fields"}, the fields written.
+    """
+    write_prompt(db, uuid, key, data, partial=True)
+    return {"uuid": uuid, "fields": [field for field in PROMPT_WRITABLE if field in data]}
+
+
+@app.post("/prompt/{uuid}/touch")
+def touch_prompt(uuid: str, db: Session = Depends(get_db)):
+    """
+    Record that a prompt's feed was viewed.
+    Prompts that are not viewed for a while are expired by the retention
+    collector; viewing an expired prompt enables it again.
+    """
+    db_prompt = db.query(Prompt).filter(Prompt.uuid == uuid).first()
+    if db_prompt is None:
+        raise HTTPException(status_code=404, detail="Prompt not found")
+    now = datetime.utcnow()
+    # At most one write per hour and prompt
+    if not db_prompt.enable or not db_prompt.lastused_at or now - db_prompt.lastused_at > timedelta(hours=1):
+        enabled = not db_prompt.enable
+        if enabled:
+            db_prompt.scored_at = None
+        db_prompt.lastused_at = now
+        db_prompt.enable = True
+        db.commit()
+        if enabled:
+            event_bus.publish(events.PROMPT_CHANGED, uuid)
+    return {"uuid": uuid, "lastused_at": db_prompt.lastused_at}
+
+
 # API Endpoints for RSSItem (articles)
 @app.get("/rss-item/{uuid}", response_model=RSSItemResponse)
-def get_rss_item(uuid: str, db: Session = Depends(get_db)):
-    rss_item = db.query(RSSItem).filter(RSSItem.uuid == uuid).first()
+def get_rss_item(uuid: str, fields: Optional[str] = None, db: Session = Depends(get_db)):
+    """An article; ?fields=uuid,title returns (and reads) only those fields."""
+    names = parse_fields(fields, RSSItemResponse)
+    query = db.query(RSSItem).filter(RSSItem.uuid == uuid)
+    if names is not None:
+        query = query.options(load_only(*[getattr(RSSItem, name) for name in names]))
+    rss_item = query.first()
     if rss_item is None:
         raise HTTPException(status_code=404, detail="RSSItem not found")
-    return rss_item
+    if names is None:
+        return rss_item
+    return partial_response(RSSItemResponse, {name: getattr(rss_item, name) for name in names})
 
 
-@app.post("/rss-item/", response_model=RSSItemResponse)
-def create_rss_item(rss_item: RSSItemCreate, db: Session = Depends(get_db)):
-    existing_rss_item = db.query(RSSItem).filter_by(link=rss_item.link).first()
-    if existing_rss_item:
-        raise HTTPException(
-            status_code=409, detail="RSSItem with this link already exists"
-        )
-    new_rss_item = RSSItem(
+def new_rss_item(rss_item: RSSItemCreate) -> RSSItem:
+    return RSSItem(
         link=rss_item.link,
         title=rss_item.title,
         description=rss_item.description,
-        pubDate=rss_item.pubDate,
+        pubDate=rss_item.pubDate or datetime.utcnow(),
         uuid=secrets.token_hex(12),
         source=rss_item.source,
         categorie=rss_item.categorie,
     )
-    db.add(new_rss_item)
+
+
+@app.post("/rss-item/", response_model=RSSItemResponse)
+def create_rss_item(rss_item: RSSItemCreate, db: Session = Depends(get_db)):
+    existing_rss_item = db.query(RSSItem).filter_by(link=rss_item.link).first()
+    if existing_rss_item:
+        raise HTTPException(
+            status_code=409, detail="RSSItem with this link already exists"
+        )
+    rss_item = new_rss_item(rss_item)
+    db.add(rss_item)
+    database.bump_data_version(db)
     db.commit()
-    db.refresh(new_rss_item)
-    return new_rss_item
+    db.refresh(rss_item)
+    event_bus.publish(events.ARTICLE_CREATED, rss_item.uuid)
+    return rss_item
 
 
-@app.put("/rss-item/{uuid}", response_model=RSSItemResponse)
-def update_rss_item(uuid: str, data: dict, db: Session = Depends(get_db)):
-    rss_item = db.query(RSSItem).filter(RSSItem.uuid == uuid).first()
+@app.post("/rss-items/batch", response_model=List[RSSItemBatchResult])
+def create_rss_items(rss_items: List[RSSItemCreate], db: Session = Depends(get_db)):
+    """
+    Create many articles at once.
+    Known links are found with a single IN query and skipped, as are links
+    repeated within the batch. All new articles are committed together.
+
+    Returns:
+        One {"link", "uuid", "status"} per submitted item, where status is
+        "created" or "duplicate".
+    """
+    links = list(dict.fromkeys(item.link for item in rss_items))
+    known = dict(
+        db.query(RSSItem.link, RSSItem.uuid).filter(RSSItem.link.in_(links)).all()
+    ) if links else {}
+    results = []
+    created = []
+    for item in rss_items:
+        if item.link in known:
+            results.append({"link": item.link, "uuid": known[item.link], "status": "duplicate"})
+            continue
+        rss_item = new_rss_item(item)
+        known[item.link] = rss_item.uuid
+        created.append(rss_item)
+        results.append({"link": item.link, "uuid": rss_item.uuid, "status": "created"})
+    if created:
+        db.add_all(created)
+        database.bump_data_version(db)
+        db.commit()
+        for result in results:
+            if result["status"] == "created":
+                event_bus.publish(events.ARTICLE_CREATED, result["uuid"])
+    return results
+
+
+def write_rss_item(db, uuid, data, partial=False):
+    """
+    Apply an update to an article and commit.
+    Args:
+        data: The fields to write; see RSS_ITEM_WRITABLE, other keys are ignored.
+        partial: Only load the primary key instead of the whole row.
+    """
+    query = db.query(RSSItem).filter(RSSItem.uuid == uuid)
+    if partial:
+        query = query.options(load_only(RSSItem.uuid))
+    rss_item = query.first()
 
     if not rss_item:
         raise HTTPException(status_code=404, detail="RSSItem not found")
+    # Validate the embedding before anything is written
+    if "embedding" in data:
+        rss_item.embedding = parse_embedding(data["embedding"])
     if "tags" in data:
         rss_item.tags = data["tags"]
-    if "embedding" in data:
-        rss_item.embedding = data["embedding"]
+        entities.index_article(db, rss_item.uuid, rss_item.tags)
+    if "embedding" in data or "tags" in data:
+        rss_item.embedded_at = datetime.utcnow()
     if "ogp" in data:
         rss_item.ogp = [data["ogp"]]
-        logging.info(f"OQP: {data["ogp"]}")
+        logging.info(f"OQP: {data['ogp']}")
     if "similar" in data:
         rss_item.similar = data["similar"]
     if "ner_count" in data:
         rss_item.ner_count = data["ner_count"]
+        # The NER worker is done with the article
+        rss_item.leased_by = None
+        rss_item.lease_until = None
     if "image" in data:
         rss_item.image = data["image"]
+    if any(field in data for field in LISTED_FIELDS):
+        database.bump_data_version(db)
     db.commit()
+    if "embedding" in data or "tags" in data:
+        embedding_index.upsert(
+            rss_item.uuid,
+            rss_item.embedding,
+            entities.lookup(db, rss_item.tags),
+            rss_item.embedded_at,
+            rss_item.pubDate,
+        )
+        event_bus.publish(events.ARTICLE_EMBEDDED, rss_item.uuid)
+    return rss_item
+
+
+@app.put("/rss-item/{uuid}", response_model=RSSItemResponse)
+def update_rss_item(uuid: str, data: dict, db: Session = Depends(get_db)):
+    rss_item = write_rss_item(db, uuid, data)
     db.refresh(rss_item)
     return rss_item
 
 
+@app.patch("/rss-item/{uuid}")
+def patch_rss_item(uuid: str, data: dict, db: Session = Depends(get_db)):
+    """
+    Update only the given fields of an article (see RSSItemClient.update).
+    The row is not read back: returns {"uuid", "fields"}, the fields written.
+    """
+    write_rss_item(db, uuid, data, partial=True)
+    return {"uuid": uuid, "fields": [field for field in RSS_ITEM_WRITABLE if field in data]}
+
+
 if __name__ == "__main__":
     uvicorn.run("app:app", host="0.0.0.0", port=8000, log_level="info", reload=True)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: backend/bench_sqlite.py
+Description: Concurrent reader / writer throughput of the SQLite profiles.
+A writer thread inserts and updates articles (as the feedparser and NER
+workers do through the API) while reader threads page through the front
+page and category listings (as the frontend does). Each profile runs on a
+fresh copy of the same database.
+
+Usage: python bench_sqlite.py [--articles 20000] [--readers 4] [--seconds 10]
+"""
+
+import os
+import sys
+import time
+import random
+import secrets
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../common")))
+from models import Base, RSSItem
+import database
+
+CATEGORIES = ["international", "politique", "nouvelle", "economie", "science", "education"]
+
+
+def seed(engine, count):
+    now = datetime.utcnow()
+    rows = [
+        {
+            "uuid": secrets.token_hex(12),
+            "link": f"https://example.com/{i}",
+            "title": f"Article {i}",
+            "description": "x" * 400,
+            "pubDate": now - timedelta(seconds=random.randint(0, 48 * 3600)),
+            "source": "bench",
+            "categorie": random.choice(CATEGORIES),
+            "frontpage_id": i % 50 if i % 50 < 10 else 0,
+            "ner_count": random.randint(0, 4),
+        }
+        for i in range(count)
+    ]
+    with engine.begin() as conn:
+        conn.execute(RSSItem.__table__.insert(), rows)
+
+
+def reader(engine, stop, stats, slot):
+    Session = sessionmaker(bind=engine)
+    done = errors = 0
+    while not stop.is_set():
+        db = Session()
+        try:
+            query = db.query(RSSItem.uuid, RSSItem.title, RSSItem.pubDate)
+            if done % 2:
+                query = query.filter(RSSItem.categorie == random.choice(CATEGORIES))
+            query.order_by(RSSItem.pubDate.desc()).offset(15 * random.randint(0, 20)).limit(15).all()
+            db.query(RSSItem.uuid).filter(RSSItem.frontpage_id > 0).order_by(
+                RSSItem.frontpage_id.asc(), RSSItem.pubDate.desc()
+            ).all()
+            done += 1
+        except OperationalError:
+            errors += 1
+        finally:
+            db.close()
+    stats[slot] = (done, errors)
+
+
+def writer(engine, stop, stats, slot, uuids):
+    Session = sessionmaker(bind=engine)
+    done = errors = 0
+    while not stop.is_set():
+        db = Session()
+        try:
+            db.execute(
+                RSSItem.__table__.insert(),
+                {
+                    "uuid": secrets.token_hex(12),
+                    "link": f"https://example.com/{secrets.token_hex(8)}",
+                    "title": "New article",
+                    "pubDate": datetime.utcnow(),
+                    "source": "bench",
+                    "categorie": random.choice(CATEGORIES),
+                },
+            )
+            db.query(RSSItem).filter(RSSItem.uuid == random.choice(uuids)).update(
+                {RSSItem.ner_count: RSSItem.ner_count + 1}
+            )
+            db.commit()
+            done += 1
+        except OperationalError:
+            db.rollback()
+            errors += 1
+        finally:
+            db.close()
+    stats[slot] = (done, errors)
+
+
+def run(profile, path, readers, seconds):
+    engine = database.create_sqlite_engine(path, profile=profile, echo=False)
+    with engine.connect() as conn:
+        uuids = [uuid for (uuid,) in conn.execute(text("SELECT uuid FROM rss_items"))]
+    if profile == "production":
+        read_engine = database.create_sqlite_engine(path, readonly=True, profile=profile, echo=False)
+    else:
+        read_engine = engine
+    stop = threading.Event()
+    stats = [None] * (readers + 1)
+    threads = [threading.Thread(target=writer, args=(engine, stop, stats, 0, uuids))]
+    threads += [
+        threading.Thread(target=reader, args=(read_engine, stop, stats, i + 1))
+        for i in range(readers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    read_engine.dispose()
+    reads = sum(done for done, _ in stats[1:])
+    read_errors = sum(errors for _, errors in stats[1:])
+    return stats[0][0] / seconds, stats[0][1], reads / seconds, read_errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--articles", type=int, default=20000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for profile in ("default", "production"):
+            path = os.path.join(tmp, f"{profile}.db")
+            engine = database.create_sqlite_engine(path, profile=profile, echo=False)
+            if profile == "default":
+                # Before: no query indexes besides the primary and unique keys
+                for table in Base.metadata.sorted_tables:
+                    table.create(engine)
+                    for index in table.indexes:
+                        index.drop(engine)
+            else:
+                Base.metadata.create_all(engine)
+            random.seed(0)
+            seed(engine, args.articles)
+            engine.dispose()
+            results[profile] = run(profile, path, args.readers, args.seconds)
+
+    print(f"{'profile':<12}{'writes/s':>10}{'w-errors':>10}{'reads/s':>10}{'r-errors':>10}")
+    for profile, (writes, write_errors, reads, read_errors) in results.items():
+        print(f"{profile:<12}{writes:>10.1f}{write_errors:>10}{reads:>10.1f}{read_errors:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: backend/entities.py
+Description: Interning of normalized NER entities and maintenance of the
+entity -> article postings table.
+"""
+
+import threading
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from models import Entity, EntityPosting
+import utils
+
+# name -> id cache of the entity table, committed entities only: an id
+# created by a transaction that rolls back may be given to another name.
+_cache = {}
+_lock = threading.Lock()
+# Cached value of the names no entity has (yet): prompts mention many names
+# that no article does. Replaced by the id when intern() commits the entity.
+UNKNOWN = None
+BATCH_SIZE = 500
+# Key of the entities created by the current transaction in Session.info
+PENDING = "entities.pending"
+
+
+def lookup(db, tags):
+    """
+    Returns the ids of the known entities found in a list of NER tags.
+    Unknown entities are ignored: no article can mention them.
+    """
+    return lookup_many(db, [tags])[0]
+
+
+def lookup_many(db, tags_list):
+    """lookup() for many lists of NER tags, with one query for the uncached names."""
+    names_list = [utils.entity_names(tags) for tags in tags_list]
+    missing = list({name for names in names_list for name in names if name not in _cache})
+    for start in range(0, len(missing), BATCH_SIZE):
+        batch = missing[start : start + BATCH_SIZE]
+        found = dict(db.query(Entity.name, Entity.id).filter(Entity.name.in_(batch)).all())
+        with _lock:
+            _cache.update((name, found.get(name, UNKNOWN)) for name in batch)
+    return [
+        [_cache[name] for name in names if _cache.get(name) is not UNKNOWN]
+        for names in names_list
+    ]
+
+
+def intern(db, tags):
+    """
+    Returns the ids of the entities in a list of NER tags, creating missing
+    ones. Names created meanwhile by another writer are ignored by the
+    insert and read back. New ids enter the cache when the transaction commits.
+    """
+    lookup(db, tags)
+    names = utils.entity_names(tags)
+    missing = [name for name in names if _cache.get(name) is UNKNOWN]
+    created = {}
+    if missing:
+        db.execute(
+            insert(Entity).prefix_with("OR IGNORE"), [{"name": name} for name in missing]
+        )
+        created = dict(
+            db.query(Entity.name, Entity.id).filter(Entity.name.in_(missing)).all()
+        )
+        db.info.setdefault(PENDING, {}).update(created)
+    return [created[name] if name in created else _cache[name] for name in names]
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_committed(session):
+    created = session.info.pop(PENDING, None)
+    if created:
+        with _lock:
+            _cache.update(created)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session):
+    session.info.pop(PENDING, None)
+
+
+def index_article(db, uuid, tags):
+    """
+    Replaces the postings of an article with the entities in its tags.
+    The caller commits. Returns the entity ids.
+    """
+    ids = intern(db, tags)
+    db.query(EntityPosting).filter(EntityPosting.article_uuid == uuid).delete(
+        synchronize_session=False
+    )
+    db.add_all(EntityPosting(entity_id, uuid) for entity_id in ids)
+    return ids
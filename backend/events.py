@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: backend/events.py
+Description: In-process change events for the workers. Endpoints publish
+an event after each committed change (article created, article embedded,
+prompt changed); workers long-poll GET /events to wake up as soon as there
+is work instead of sleeping a fixed interval. Events are numbered and the
+last LNQ_EVENTS_BUFFER are kept, so a worker that reconnects with its last
+sequence number misses nothing (or is told to resynchronize). Sequence
+numbers restart with the backend: each bus has a random epoch, and a
+cursor from another epoch is always reset.
+"""
+
+import asyncio
+import os
+import secrets
+import threading
+import time
+from collections import deque
+
+LNQ_EVENTS_BUFFER = int(os.getenv("LNQ_EVENTS_BUFFER", "1000"))
+
+ARTICLE_CREATED = "article.created"
+ARTICLE_EMBEDDED = "article.embedded"
+PROMPT_CHANGED = "prompt.changed"
+
+
+class EventBus:
+
+    def __init__(self, size=LNQ_EVENTS_BUFFER):
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=size)
+        self._seq = 0
+        self._waiters = set()
+        # Identifies this bus (and backend process) in the workers' cursors
+        self.epoch = secrets.token_hex(8)
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def publish(self, type, uuid=None):
+        """Record an event and wake up the waiting requests (any thread)."""
+        with self._lock:
+            self._seq += 1
+            self._events.append({"seq": self._seq, "type": type, "uuid": uuid})
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def since(self, seq, types=None):
+        """
+        Events after `seq`.
+        Returns:
+            (events, last, reset): `last` is the sequence number to resume
+            from. reset is True when events after `seq` were dropped from
+            the buffer or `seq` is unknown (backend restarted); the caller
+            must then rescan instead of relying on events.
+        """
+        with self._lock:
+            oldest = self._events[0]["seq"] if self._events else self._seq + 1
+            reset = seq > self._seq or seq < oldest - 1
+            events = [
+                event for event in self._events
+                if event["seq"] > seq and (not types or event["type"] in types)
+            ]
+            return events, self._seq, reset
+
+    async def wait(self, seq, types=None, timeout=25.0):
+        """Wait up to `timeout` seconds for events after `seq` (see since())."""
+        deadline = time.monotonic() + timeout
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            while True:
+                waiter[1].clear()
+                events, last, reset = self.since(seq, types)
+                remaining = deadline - time.monotonic()
+                if events or reset or remaining <= 0:
+                    return events, last, reset
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
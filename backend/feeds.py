@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: backend/feeds.py
+Description: Maintenance of the prompt_feed table: one row per
+(prompt, article) match with its score and the article pubDate, so that a
+feed page is a single indexed join ordered by score or date.
+"""
+
+from sqlalchemy import delete, insert, update
+
+from models import PromptFeed, RSSItem
+
+BATCH_SIZE = 500
+
+
+def load(db, prompt_uuid=None):
+    """
+    Returns the current feeds as {prompt_uuid: {article_uuid: score}}, or
+    only {article_uuid: score} for the given prompt.
+    """
+    query = db.query(PromptFeed.prompt_uuid, PromptFeed.article_uuid, PromptFeed.score)
+    if prompt_uuid is not None:
+        query = query.filter(PromptFeed.prompt_uuid == prompt_uuid)
+    current = {}
+    for uuid, article_uuid, score in query.yield_per(5000):
+        current.setdefault(uuid, {})[article_uuid] = score
+    if prompt_uuid is not None:
+        return current.get(prompt_uuid, {})
+    return current
+
+
+def load_articles(db, article_uuids):
+    """
+    The stored scores of some articles, as {prompt_uuid: {article_uuid: score}}.
+    Reads only the rows of these articles, whatever the size of the feeds.
+    """
+    article_uuids = list(article_uuids)
+    current = {}
+    for start in range(0, len(article_uuids), BATCH_SIZE):
+        rows = db.query(PromptFeed.prompt_uuid, PromptFeed.article_uuid, PromptFeed.score).filter(
+            PromptFeed.article_uuid.in_(article_uuids[start : start + BATCH_SIZE])
+        )
+        for prompt_uuid, uuid, score in rows:
+            current.setdefault(prompt_uuid, {})[uuid] = score
+    return current
+
+
+def entries(db, prompt_uuid):
+    """The feed of a prompt as a list of {"uuid", "score"}, best score first."""
+    rows = (
+        db.query(PromptFeed.article_uuid, PromptFeed.score)
+        .filter(PromptFeed.prompt_uuid == prompt_uuid)
+        .order_by(PromptFeed.score.desc(), PromptFeed.article_uuid.desc())
+    )
+    return [{"uuid": uuid, "score": score} for uuid, score in rows]
+
+
+def entries_many(db, prompt_uuids):
+    """The feeds of some prompts, as {prompt_uuid: entries()}, in one query."""
+    current = {}
+    rows = (
+        db.query(PromptFeed.prompt_uuid, PromptFeed.article_uuid, PromptFeed.score)
+        .filter(PromptFeed.prompt_uuid.in_(prompt_uuids))
+        .order_by(PromptFeed.prompt_uuid, PromptFeed.score.desc(), PromptFeed.article_uuid.desc())
+    )
+    for prompt_uuid, uuid, score in rows:
+        current.setdefault(prompt_uuid, []).append({"uuid": uuid, "score": score})
+    return current
+
+
+def save(db, prompt_uuid, old, new):
+    """
+    Writes the difference between two feeds of a prompt. The caller commits.
+    Args:
+        old: {article_uuid: score} currently stored (see load()).
+        new: List of {"uuid", "score"}; articles that no longer exist are skipped.
+
+    Returns:
+        True if anything changed.
+    """
+    new = {entry["uuid"]: float(entry["score"]) for entry in new or []}
+    removed = [uuid for uuid in old if uuid not in new]
+    added = [uuid for uuid in new if uuid not in old]
+    changed = [
+        {"prompt_uuid": prompt_uuid, "article_uuid": uuid, "score": score}
+        for uuid, score in new.items()
+        if uuid in old and old[uuid] != score
+    ]
+    for start in range(0, len(removed), BATCH_SIZE):
+        db.execute(
+            delete(PromptFeed).where(
+                PromptFeed.prompt_uuid == prompt_uuid,
+                PromptFeed.article_uuid.in_(removed[start : start + BATCH_SIZE]),
+            )
+        )
+    for start in range(0, len(added), BATCH_SIZE):
+        rows = [
+            {"prompt_uuid": prompt_uuid, "article_uuid": uuid, "score": new[uuid], "pubDate": pubDate}
+            for uuid, pubDate in db.query(RSSItem.uuid, RSSItem.pubDate).filter(
+                RSSItem.uuid.in_(added[start : start + BATCH_SIZE])
+            )
+        ]
+        if rows:
+            db.execute(insert(PromptFeed), rows)
+    if changed:
+        db.execute(update(PromptFeed), changed)
+    return bool(removed or added or changed)
+
+
+def trim(db, prompt_uuid, size):
+    """Keeps the `size` best scored articles of a feed. The caller commits."""
+    extra = [
+        uuid
+        for uuid, in db.query(PromptFeed.article_uuid)
+        .filter(PromptFeed.prompt_uuid == prompt_uuid)
+        .order_by(PromptFeed.score.desc(), PromptFeed.article_uuid.desc())
+        .offset(size)
+    ]
+    for start in range(0, len(extra), BATCH_SIZE):
+        db.execute(
+            delete(PromptFeed).where(
+                PromptFeed.prompt_uuid == prompt_uuid,
+                PromptFeed.article_uuid.in_(extra[start : start + BATCH_SIZE]),
+            )
+        )
+    return bool(extra)
+
+
+def remove_expired(db, prompt_uuids, not_before):
+    """
+    Removes the articles published before `not_before` from some feeds.
+    The caller commits. Returns the uuids of the prompts whose feed changed.
+    """
+    changed = set()
+    for start in range(0, len(prompt_uuids), BATCH_SIZE):
+        changed.update(
+            db.execute(
+                delete(PromptFeed)
+                .where(
+                    PromptFeed.prompt_uuid.in_(prompt_uuids[start : start + BATCH_SIZE]),
+                    PromptFeed.pubDate < not_before,
+                )
+                .returning(PromptFeed.prompt_uuid)
+            ).scalars()
+        )
+    return changed
+
+
+def clear(db, prompt_uuids):
+    """Empties the feeds of some prompts. The caller commits."""
+    for start in range(0, len(prompt_uuids), BATCH_SIZE):
+        db.execute(
+            delete(PromptFeed).where(
+                PromptFeed.prompt_uuid.in_(prompt_uuids[start : start + BATCH_SIZE])
+            )
+        )
+
+
+def remove_articles(db, article_uuids):
+    """Removes deleted articles from every feed. The caller commits."""
+    db.execute(delete(PromptFeed).where(PromptFeed.article_uuid.in_(article_uuids)))
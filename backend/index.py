@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: backend/index.py
+Description: Resident in-memory index of article embeddings used by the
+search endpoint. All vectors live in a single pre-normalized float32 matrix
+so that scoring a prompt is one matrix-vector product. Entity overlap is
+scored from in-memory postings (entity id -> article uuids).
+"""
+
+import threading
+import logging
+import numpy as np
+from datetime import timezone
+
+import vectors
+
+
+def _epoch(value, default=0.0):
+    """Seconds since the epoch of a naive UTC datetime."""
+    if value is None:
+        return default
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class EmbeddingIndex:
+    """In-memory matrix of L2-normalized article embeddings, keyed by uuid."""
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self._capacity = capacity
+        self._dim = None
+        self._matrix = None
+        self._entity_counts = None
+        self._embedded_at = None
+        self._published_at = None
+        self._uuids = []
+        self._rows = {}
+        self._entities = []
+        self._postings = {}
+        self._posting_rows = {}
+
+    def __len__(self):
+        return len(self._uuids)
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = vectors.to_array(embedding)
+        if vector is None:
+            return None
+        norm = np.linalg.norm(vector)
+        if norm == 0 or not np.isfinite(norm):
+            return None
+        return vector / norm
+
+    def _grow(self, size):
+        capacity = max(self._capacity, 1)
+        while capacity < size:
+            capacity *= 2
+        used = len(self._uuids)
+        matrix = np.zeros((capacity, self._dim), dtype=np.float32)
+        entity_counts = np.zeros(capacity, dtype=np.float32)
+        embedded_at = np.zeros(capacity, dtype=np.float64)
+        published_at = np.zeros(capacity, dtype=np.float64)
+        if self._matrix is not None:
+            matrix[:used] = self._matrix[:used]
+            entity_counts[:used] = self._entity_counts[:used]
+            embedded_at[:used] = self._embedded_at[:used]
+            published_at[:used] = self._published_at[:used]
+        self._matrix = matrix
+        self._entity_counts = entity_counts
+        self._embedded_at = embedded_at
+        self._published_at = published_at
+        self._capacity = capacity
+
+    def load(self, items, postings=()):
+        """
+        Rebuild the index.
+        Args:
+            items: Iterable of (uuid, embedding, embedded_at, pubDate) rows.
+            postings: Iterable of (article_uuid, entity_id) pairs.
+        """
+        entities = {}
+        for uuid, entity_id in postings:
+            entities.setdefault(uuid, []).append(entity_id)
+        with self._lock:
+            self._dim = None
+            self._matrix = None
+            self._entity_counts = None
+            self._embedded_at = None
+            self._published_at = None
+            self._uuids = []
+            self._rows = {}
+            self._entities = []
+            self._postings = {}
+            self._posting_rows = {}
+        for uuid, embedding, embedded_at, published_at in items:
+            self.upsert(uuid, embedding, entities.get(uuid), embedded_at, published_at)
+        logging.info(f"Embedding index loaded: {len(self)} articles")
+
+    def upsert(self, uuid, embedding, entity_ids=None, embedded_at=None, published_at=None):
+        """
+        Insert or replace an article.
+        Args:
+            uuid: The article uuid.
+            embedding: The article embedding (blob, list or array).
+            entity_ids: The ids of the article's normalized entities.
+            embedded_at: When the embedding was written (UTC datetime).
+            published_at: The article pubDate (UTC datetime).
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            if vector is None:
+                self._remove(uuid)
+                return
+            if self._dim is None:
+                self._dim = vector.shape[0]
+            if vector.shape[0] != self._dim:
+                logging.warning(
+                    f"Embedding index: {uuid} has dimension {vector.shape[0]}, expected {self._dim}"
+                )
+                self._remove(uuid)
+                return
+            row = self._rows.get(uuid)
+            if row is None:
+                row = len(self._uuids)
+                if self._matrix is None or row >= self._capacity:
+                    self._grow(row + 1)
+                self._uuids.append(uuid)
+                self._entities.append(frozenset())
+                self._rows[uuid] = row
+            self._matrix[row] = vector
+            self._embedded_at[row] = _epoch(embedded_at)
+            self._published_at[row] = _epoch(published_at)
+            self._set_entities(row, frozenset(entity_ids or ()))
+
+    def remove(self, uuid):
+        with self._lock:
+            self._remove(uuid)
+
+    def _set_entities(self, row, entity_ids):
+        for entity_id in self._entities[row] - entity_ids:
+            posting = self._postings[entity_id]
+            posting.discard(row)
+            if not posting:
+                del self._postings[entity_id]
+            self._posting_rows.pop(entity_id, None)
+        for entity_id in entity_ids - self._entities[row]:
+            self._postings.setdefault(entity_id, set()).add(row)
+            self._posting_rows.pop(entity_id, None)
+        self._entities[row] = entity_ids
+        self._entity_counts[row] = len(entity_ids)
+
+    def _remove(self, uuid):
+        # Swap the last row into the hole so the matrix stays dense.
+        row = self._rows.pop(uuid, None)
+        if row is None:
+            return
+        self._set_entities(row, frozenset())
+        last = len(self._uuids) - 1
+        if row != last:
+            moved = self._entities[last]
+            self._set_entities(last, frozenset())
+            self._matrix[row] = self._matrix[last]
+            self._embedded_at[row] = self._embedded_at[last]
+            self._published_at[row] = self._published_at[last]
+            self._uuids[row] = self._uuids[last]
+            self._rows[self._uuids[row]] = row
+            self._set_entities(row, moved)
+        self._uuids.pop()
+        self._entities.pop()
+
+    def _rows_of(self, entity_id):
+        rows = self._posting_rows.get(entity_id)
+        if rows is None:
+            posting = self._postings.get(entity_id, ())
+            rows = np.fromiter(posting, dtype=np.intp, count=len(posting))
+            self._posting_rows[entity_id] = rows
+        return rows
+
+    def _add_ner_scores(self, scores, entity_ids, columns):
+        # Adds the share of each article's entities that the prompt mentions,
+        # as in utils.calculate_ner, computed from the postings of the
+        # prompt's entities instead of a scan over every article.
+        postings = [self._rows_of(entity_id) for entity_id in set(entity_ids)]
+        if not postings:
+            return
+        rows, counts = np.unique(np.concatenate(postings), return_counts=True)
+        positions = columns[rows]
+        scored = positions >= 0
+        scores[positions[scored]] += (
+            counts[scored] / self._entity_counts[rows[scored]]
+        )
+
+    def search(self, embedding, entity_ids=None, threshold=0.9, k=1000):
+        """
+        Score every article against a prompt.
+        Args:
+            embedding: The prompt embedding (blob, list or array).
+            entity_ids: The ids of the prompt's normalized entities.
+            threshold: Minimum total score (similarity + NER overlap).
+            k: Maximum number of articles returned.
+
+        Returns:
+            List of {"uuid", "score"} sorted by descending score.
+        """
+        return self.search_many([embedding], [entity_ids], threshold, k)[0]
+
+    def search_many(
+        self,
+        embeddings,
+        entity_ids,
+        threshold=0.9,
+        k=1000,
+        since=None,
+        not_before=None,
+        block=256,
+    ):
+        """
+        Score articles against many prompts at once.
+        Prompt vectors are stacked into a matrix and scored against the
+        article matrix with one matrix product per block of prompts (the
+        block bounds the size of the score matrix).
+        Args:
+            embeddings: One embedding per prompt.
+            entity_ids: One list of entity ids per prompt.
+            threshold: Minimum total score (similarity + NER overlap).
+            k: Maximum number of articles returned per prompt.
+            since: Optional watermark per prompt (UTC datetime or None).
+                Only articles embedded after it are scored for that prompt.
+            not_before: Optional UTC datetime; older articles are skipped.
+            block: Number of prompts scored per matrix product.
+
+        Returns:
+            One list of {"uuid", "score"} per prompt, as search() does.
+        """
+        return self.search_since(
+            embeddings, entity_ids, threshold, k, since, not_before, block
+        )[0]
+
+    def search_since(
+        self,
+        embeddings,
+        entity_ids,
+        threshold=0.9,
+        k=1000,
+        since=None,
+        not_before=None,
+        block=256,
+    ):
+        """
+        search_many(), also returning the articles each prompt was scored
+        against, from the same snapshot of the index: a feed refresh may only
+        drop the stored entries of these articles.
+        Returns:
+            (results, scored): scored holds one set of uuids per prompt, or
+            None when every article was scored (no watermark).
+        """
+        queries = [self._normalize(embedding) for embedding in embeddings]
+        since = since or [None] * len(queries)
+        marks = np.array([_epoch(mark, -np.inf) for mark in since])
+        results = [[] for _ in queries]
+        scored = [set() for _ in queries]
+        with self._lock:
+            size = len(self._uuids)
+            valid = [
+                i for i, query in enumerate(queries)
+                if query is not None and size and query.shape[0] == self._dim
+            ]
+            for i in valid:
+                if since[i] is None:
+                    scored[i] = None
+            if not valid:
+                return results, scored
+
+            # Only the articles newer than the oldest watermark take part.
+            embedded_at = self._embedded_at[:size]
+            mask = embedded_at > marks[valid].min()
+            if not_before is not None:
+                mask &= self._published_at[:size] >= _epoch(not_before)
+            rows = np.flatnonzero(mask)
+            if rows.size == 0:
+                return results, scored
+            matrix = self._matrix[:size] if rows.size == size else self._matrix[rows]
+            columns = np.full(size, -1, dtype=np.intp)
+            columns[rows] = np.arange(rows.size)
+
+            for start in range(0, len(valid), block):
+                prompts = valid[start : start + block]
+                scores = np.stack([queries[i] for i in prompts]) @ matrix.T
+                for line, i in enumerate(prompts):
+                    if entity_ids[i]:
+                        self._add_ner_scores(scores[line], entity_ids[i], columns)
+                    stale = embedded_at[rows] <= marks[i]
+                    scores[line][stale] = -np.inf
+                    results[i] = self._select(scores[line], rows, threshold, k)
+                    if scored[i] is not None:
+                        scored[i] = {self._uuids[row] for row in rows[~stale]}
+        return results, scored
+
+    def _select(self, scores, rows, threshold, k):
+        candidates = np.flatnonzero(scores > threshold)
+        if candidates.size > k:
+            top = np.argpartition(scores[candidates], -k)[-k:]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [
+            {"uuid": self._uuids[rows[column]], "score": float(scores[column])}
+            for column in candidates
+        ]
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: backend/migrations.py
+Description: In-place upgrades of an existing SQLite database. Every step
+is idempotent and runs at backend startup, after create_all(). It can also
+be run by hand: python migrations.py
+"""
+
+import os
+import sys
+import json
+import base64
+import logging
+from sqlalchemy import bindparam, text
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../common")))
+import utils
+import vectors
+from models import Base
+from image_store import ImageStore, default_root
+
+BATCH_SIZE = 500
+# Indexes replaced by wider ones (prefixes of the keyset pagination indexes)
+OBSOLETE_INDEXES = ("ix_rss_items_pubDate", "ix_rss_items_categorie_pubDate")
+
+
+def add_column(engine, table, column, ddl):
+    """Add a column to an existing table unless it is already there."""
+    with engine.begin() as conn:
+        columns = [row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))]
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+            logging.info(f"Added column {table}.{column}")
+
+
+def migrate_embeddings(engine):
+    """Convert JSON-encoded embeddings into binary blobs."""
+    for table in ("rss_items", "prompt"):
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text(
+                    f"SELECT uuid, embedding FROM {table} "
+                    "WHERE typeof(embedding) = 'text'"
+                )
+            ).fetchall()
+            for start in range(0, len(rows), BATCH_SIZE):
+                conn.execute(
+                    text(f"UPDATE {table} SET embedding = :embedding WHERE uuid = :uuid"),
+                    [
+                        {"uuid": uuid, "embedding": vectors.from_legacy(value)}
+                        for uuid, value in rows[start : start + BATCH_SIZE]
+                    ],
+                )
+        if rows:
+            logging.info(f"Migrated {len(rows)} {table} embeddings to binary")
+
+
+def migrate_entity_postings(engine):
+    """Build the entity postings of articles tagged before the inverted index existed."""
+    with engine.begin() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT uuid, tags FROM rss_items "
+                "WHERE tags IS NOT NULL AND tags != '[]' "
+                "AND uuid NOT IN (SELECT article_uuid FROM entity_posting)"
+            )
+        ).fetchall()
+        for uuid, tags in rows:
+            names = utils.entity_names(json.loads(tags))
+            if not names:
+                continue
+            conn.execute(
+                text("INSERT OR IGNORE INTO entity (name) VALUES (:name)"),
+                [{"name": name} for name in names],
+            )
+            conn.execute(
+                text(
+                    "INSERT OR IGNORE INTO entity_posting (entity_id, article_uuid) "
+                    "SELECT id, :uuid FROM entity WHERE name = :name"
+                ),
+                [{"uuid": uuid, "name": name} for name in names],
+            )
+    if rows:
+        logging.info(f"Indexed entities of {len(rows)} articles")
+
+
+def migrate_feed_watermarks(engine):
+    """Columns used for incremental feed refreshes."""
+    add_column(engine, "rss_items", "embedded_at", "DATETIME")
+    add_column(engine, "prompt", "scored_at", "DATETIME")
+
+
+def migrate_ner_leases(engine):
+    """Columns used to lease NER work to a worker."""
+    for table in ("rss_items", "prompt"):
+        add_column(engine, table, "leased_by", "VARCHAR")
+        add_column(engine, table, "lease_until", "DATETIME")
+
+
+def migrate_indexes(engine):
+    """Create the query indexes declared on the models (create_all skips existing tables)."""
+    with engine.begin() as conn:
+        for name in OBSOLETE_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+def migrate_prompt_feeds(engine):
+    """Move the JSON feeds of the prompts into the prompt_feed table."""
+    with engine.begin() as conn:
+        columns = [row[1] for row in conn.execute(text("PRAGMA table_info(prompt)"))]
+        if "feed" not in columns:
+            return
+        rows = conn.execute(
+            text("SELECT uuid, feed FROM prompt WHERE feed IS NOT NULL AND feed != '[]'")
+        ).fetchall()
+        for uuid, feed in rows:
+            entries = [
+                {"prompt_uuid": uuid, "article_uuid": entry["uuid"], "score": entry["score"]}
+                for entry in json.loads(feed) or []
+                if isinstance(entry, dict) and "uuid" in entry and "score" in entry
+            ]
+            for start in range(0, len(entries), BATCH_SIZE):
+                conn.execute(
+                    text(
+                        "INSERT OR REPLACE INTO prompt_feed (prompt_uuid, article_uuid, score, pubDate) "
+                        "SELECT :prompt_uuid, uuid, :score, pubDate FROM rss_items WHERE uuid = :article_uuid"
+                    ),
+                    entries[start : start + BATCH_SIZE],
+                )
+            conn.execute(text("UPDATE prompt SET feed = NULL WHERE uuid = :uuid"), {"uuid": uuid})
+    if rows:
+        logging.info(f"Moved the feeds of {len(rows)} prompts to prompt_feed")
+
+
+def migrate_images(engine):
+    """Move base64 data: URL images out of the article rows into the image store."""
+    store = ImageStore(default_root(engine.url.database))
+    with engine.connect() as conn:
+        uuids = [
+            uuid for (uuid,) in conn.execute(
+                text("SELECT uuid FROM rss_items WHERE image LIKE 'data:%'")
+            )
+        ]
+    for start in range(0, len(uuids), BATCH_SIZE):
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text("SELECT uuid, image FROM rss_items WHERE uuid IN :uuids").bindparams(
+                    bindparam("uuids", expanding=True)
+                ),
+                {"uuids": uuids[start : start + BATCH_SIZE]},
+            ).fetchall()
+            updates = []
+            for uuid, image in rows:
+                try:
+                    data = base64.b64decode(image.split(",", 1)[1])
+                except (IndexError, ValueError):
+                    continue
+                updates.append({"uuid": uuid, "image": store.put(data)})
+            if updates:
+                conn.execute(
+                    text("UPDATE rss_items SET image = :image WHERE uuid = :uuid"), updates
+                )
+    if uuids:
+        logging.info(f"Moved {len(uuids)} article images to {store.root}")
+
+
+MIGRATIONS = [
+    migrate_embeddings,
+    migrate_entity_postings,
+    migrate_feed_watermarks,
+    migrate_ner_leases,
+    migrate_indexes,
+    migrate_images,
+    migrate_prompt_feeds,
+]
+
+
+def run(engine):
+    for migration in MIGRATIONS:
+        migration(engine)
+
+
+if __name__ == "__main__":
+    import database
+
+    db_path = os.getenv("LNQ_DB_PATH", os.path.join(os.getcwd(), "db/news.db"))
+    run(database.create_sqlite_engine(db_path))
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: backend/retention.py
+Description: Background garbage collector. Keeps the article table within
+the retention window (age and count limits), removes the deleted articles
+from the entity postings, the search index and the prompt feeds, deletes
+the stored images no remaining article uses, and disables prompts that
+have not been used for a while.
+"""
+
+import os
+import threading
+import logging
+from datetime import datetime, timedelta
+
+from models import Prompt, RSSItem, EntityPosting
+import database
+import feeds
+from image_store import is_digest
+
+LNQ_RETENTION_MAX_AGE_HOURS = int(os.getenv("LNQ_RETENTION_MAX_AGE_HOURS", "48"))
+LNQ_RETENTION_MAX_ITEMS = int(os.getenv("LNQ_RETENTION_MAX_ITEMS", "1000"))
+LNQ_RETENTION_BATCH_SIZE = int(os.getenv("LNQ_RETENTION_BATCH_SIZE", "100"))
+LNQ_RETENTION_INTERVAL = int(os.getenv("LNQ_RETENTION_INTERVAL", "300"))
+LNQ_PROMPT_MAX_IDLE_DAYS = int(os.getenv("LNQ_PROMPT_MAX_IDLE_DAYS", "90"))
+
+
+class RetentionCollector:
+
+    def __init__(self, session_factory, index, images=None):
+        """
+        Args:
+            session_factory: Session class of the database.
+            index: The EmbeddingIndex of the articles.
+            images: Optional ImageStore whose unused images are deleted.
+        """
+        self.Session = session_factory
+        self.index = index
+        self.images = images
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.collect()
+            except Exception as e:
+                logging.error(f"Retention: {e}")
+            self._stop.wait(LNQ_RETENTION_INTERVAL)
+
+    def expired_articles(self, db, now):
+        """Uuids of the articles older than the window or beyond the count limit."""
+        cutoff = now - timedelta(hours=LNQ_RETENTION_MAX_AGE_HOURS)
+        too_old = db.query(RSSItem.uuid).filter(RSSItem.pubDate < cutoff)
+        too_many = (
+            db.query(RSSItem.uuid)
+            .order_by(RSSItem.pubDate.desc())
+            .offset(LNQ_RETENTION_MAX_ITEMS)
+        )
+        return list(dict.fromkeys(uuid for (uuid,) in too_old.all() + too_many.all()))
+
+    def collect(self):
+        """Run one collection pass."""
+        now = datetime.utcnow()
+        db = self.Session()
+        try:
+            uuids = self.expired_articles(db, now)
+        finally:
+            db.close()
+
+        # Small transactions keep the write lock short for the API.
+        for start in range(0, len(uuids), LNQ_RETENTION_BATCH_SIZE):
+            batch = uuids[start : start + LNQ_RETENTION_BATCH_SIZE]
+            db = self.Session()
+            try:
+                digests = {
+                    image for (image,) in db.query(RSSItem.image).filter(RSSItem.uuid.in_(batch))
+                    if is_digest(image)
+                }
+                db.query(EntityPosting).filter(EntityPosting.article_uuid.in_(batch)).delete(
+                    synchronize_session=False
+                )
+                feeds.remove_articles(db, batch)
+                database.bump_data_version(db)
+                db.query(RSSItem).filter(RSSItem.uuid.in_(batch)).delete(
+                    synchronize_session=False
+                )
+                db.commit()
+                # Images are shared by the articles with the same source image
+                if digests:
+                    digests -= {
+                        image for (image,) in db.query(RSSItem.image).filter(
+                            RSSItem.image.in_(digests)
+                        )
+                    }
+            finally:
+                db.close()
+            for uuid in batch:
+                self.index.remove(uuid)
+            self.remove_images(digests)
+            if self._stop.wait(0.05):
+                return
+
+        idle = self.expire_prompts(now)
+        if uuids or idle:
+            logging.info(f"Retention: {len(uuids)} articles deleted, {idle} prompts expired")
+
+    def remove_images(self, digests):
+        """Delete images from the image store (errors are logged, not raised)."""
+        if self.images is None:
+            return
+        for digest in digests:
+            try:
+                self.images.remove(digest)
+            except (OSError, ValueError) as e:
+                logging.error(f"Retention: cannot remove image {digest}: {e}")
+
+    def expire_prompts(self, now):
+        """Disable the prompts not used since LNQ_PROMPT_MAX_IDLE_DAYS."""
+        cutoff = now - timedelta(days=LNQ_PROMPT_MAX_IDLE_DAYS)
+        db = self.Session()
+        try:
+            uuids = [
+                uuid for (uuid,) in db.query(Prompt.uuid).filter(
+                    Prompt.enable == True, Prompt.lastused_at < cutoff
+                )
+            ]
+            if uuids:
+                db.query(Prompt).filter(Prompt.uuid.in_(uuids)).update(
+                    {Prompt.enable: False}, synchronize_session=False
+                )
+                feeds.clear(db, uuids)
+                database.bump_data_version(db)
+                db.commit()
+            return len(uuids)
+        finally:
+            db.close()
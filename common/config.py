@@ -23,3 +23,5 @@ LNQ_MODEL = os.getenv("LNQ_MODEL", "cohere")
 LNQ_CONFIG_PATH = os.getenv(
     "LNQ_CONFIG_PATH", "/home/thomas/Documents/work/LesNouvelles.Quebec/config/"
 )
+# Storage type of embeddings: float32 or float16
+LNQ_EMBEDDING_DTYPE = os.getenv("LNQ_EMBEDDING_DTYPE", "float32")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: common/database.py
+Description: SQLite engine factory shared by the backend (read-write) and
+the frontend (read-only). The "production" profile turns on WAL so that
+readers never block the writer, relaxes fsync to synchronous=NORMAL and
+sizes the page cache and memory map. The "default" profile keeps SQLite
+defaults and only exists for comparison (see backend/bench_sqlite.py).
+The data version counter tells the frontend when its cached pages are stale.
+"""
+
+import os
+from sqlalchemy import create_engine, event, text
+
+LNQ_DB_PROFILE = os.getenv("LNQ_DB_PROFILE", "production")
+LNQ_DB_ECHO = os.getenv("LNQ_DB_ECHO", "false").lower() in ("1", "true", "yes")
+LNQ_DB_POOL_SIZE = int(os.getenv("LNQ_DB_POOL_SIZE", "10"))
+LNQ_DB_MAX_OVERFLOW = int(os.getenv("LNQ_DB_MAX_OVERFLOW", "20"))
+LNQ_DB_MMAP_SIZE = int(os.getenv("LNQ_DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Negative values are in KiB
+LNQ_DB_CACHE_SIZE = int(os.getenv("LNQ_DB_CACHE_SIZE", str(-64 * 1024)))
+LNQ_DB_BUSY_TIMEOUT = int(os.getenv("LNQ_DB_BUSY_TIMEOUT", "5000"))
+
+
+def production_pragmas(readonly=False):
+    """Return the PRAGMA statements run on every new connection."""
+    pragmas = [
+        f"PRAGMA busy_timeout={LNQ_DB_BUSY_TIMEOUT}",
+        f"PRAGMA mmap_size={LNQ_DB_MMAP_SIZE}",
+        f"PRAGMA cache_size={LNQ_DB_CACHE_SIZE}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if readonly:
+        pragmas.append("PRAGMA query_only=ON")
+    else:
+        # journal_mode is stored in the database file: only the writer sets it
+        pragmas += ["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL"]
+    return pragmas
+
+
+def create_sqlite_engine(db_path, readonly=False, profile=None, echo=None):
+    """
+    Create the SQLAlchemy engine of the news database.
+    Args:
+        db_path (str): Path of the SQLite file.
+        readonly (bool): Open the file read-only (frontend).
+        profile (str): 'production' or 'default', defaults to LNQ_DB_PROFILE.
+        echo (bool): Log every SQL statement, defaults to LNQ_DB_ECHO.
+    """
+    profile = profile or LNQ_DB_PROFILE
+    url = f"sqlite:///file:{db_path}?mode=ro&uri=true" if readonly else f"sqlite:///{db_path}"
+    engine = create_engine(
+        url,
+        echo=LNQ_DB_ECHO if echo is None else echo,
+        pool_size=LNQ_DB_POOL_SIZE,
+        max_overflow=LNQ_DB_MAX_OVERFLOW,
+        connect_args={"check_same_thread": False},
+    )
+    if profile == "production":
+        register_pragmas(engine, readonly)
+    return engine
+
+
+def register_pragmas(engine, readonly=False):
+    """Run the production PRAGMAs on every connection the engine opens."""
+    pragmas = production_pragmas(readonly)
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def bump_data_version(db):
+    """
+    Increment the data version, a counter of the writes that change what
+    the listing pages show. The frontend page cache is keyed by it. Call it
+    inside the writing transaction, so the version and the data commit
+    together.
+    """
+    db.execute(
+        text(
+            "INSERT INTO meta (key, value) VALUES ('data_version', 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+        )
+    )
+
+
+def read_data_version(db):
+    """Current data version (0 before the first write)."""
+    row = db.execute(text("SELECT value FROM meta WHERE key = 'data_version'")).first()
+    return row[0] if row else 0
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: common/image_store.py
+Description: Content-addressed store of the article images. An image is
+identified by a sha256 digest (of the source image URL and banner for the
+rendered variants, see image_digest; of the bytes for migrated images)
+and every variant is stored under
+<root>/<digest[:2]>/<digest>/<variant>.<ext>; the article row only keeps
+the digest. Rendered bytes cannot be checked against their digest: the
+backend only accepts whole images of the declared format (check_image).
+The backend writes into the store and removes the images no article
+uses any more (see retention.py); the frontend serves it read-only. Once
+every variant of an image is stored its files never change, so they can
+be cached forever by browsers.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+VARIANTS = ("card", "detail")
+FORMATS = {"webp": "image/webp", "jpg": "image/jpeg"}
+
+
+def default_root(db_path):
+    """LNQ_IMAGE_ROOT, or an images/ directory next to the database."""
+    return os.getenv("LNQ_IMAGE_ROOT") or os.path.join(os.path.dirname(db_path), "images")
+
+
+def digest_of(data):
+    """sha256 hex digest of the image bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_digest(source_url, banner_text):
+    """Digest of the images rendered from a source URL with a banner text."""
+    return hashlib.sha256(f"{source_url}\0{banner_text}".encode("utf-8")).hexdigest()
+
+
+def check_image(data, ext):
+    """
+    Raises ValueError unless `data` is a whole image in the format of `ext`:
+    a JPEG from its start marker to its end marker, or a WebP whose RIFF
+    size matches the bytes received. Empty, truncated and mislabeled
+    uploads are rejected before they reach the (immutable) store.
+    """
+    if ext == "jpg":
+        valid = data[:3] == b"\xff\xd8\xff" and data[-2:] == b"\xff\xd9"
+    elif ext == "webp":
+        valid = (
+            len(data) > 16
+            and data[:4] == b"RIFF"
+            and data[8:15] == b"WEBPVP8"
+            and int.from_bytes(data[4:8], "little") + 8 == len(data)
+        )
+    else:
+        raise ValueError(f"Unknown image format: {ext}")
+    if not valid:
+        raise ValueError(f"Not a complete {ext} image ({len(data)} bytes)")
+
+
+def is_digest(value):
+    """True if `value` is an image digest (and not a legacy data: URL)."""
+    return isinstance(value, str) and DIGEST_RE.match(value) is not None
+
+
+class ImageStore:
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest, variant="detail", ext="jpg"):
+        """
+        File path of an image variant.
+        Raises ValueError on a malformed digest, variant or extension, so
+        request parameters can never escape the store.
+        """
+        if not is_digest(digest) or variant not in VARIANTS or ext not in FORMATS:
+            raise ValueError(f"Invalid image reference: {digest}/{variant}.{ext}")
+        return os.path.join(self.root, digest[:2], digest, f"{variant}.{ext}")
+
+    def exists(self, digest, variant="detail", ext="jpg"):
+        return os.path.exists(self.path(digest, variant, ext))
+
+    def complete(self, digest):
+        """True if every variant of an image is stored, in every format."""
+        return all(
+            self.exists(digest, variant, ext) for variant in VARIANTS for ext in FORMATS
+        )
+
+    def resolve(self, digest, variant="detail", ext="jpg"):
+        """
+        Path of the best stored file for a variant: the variant itself, then
+        its JPEG, then the detail JPEG (images migrated from the rows only
+        have that one). Returns (path, ext), or (None, None).
+        """
+        for candidate in ((variant, ext), (variant, "jpg"), ("detail", "jpg")):
+            path = self.path(digest, *candidate)
+            if os.path.exists(path):
+                return path, candidate[1]
+        return None, None
+
+    def is_valid(self, digest, variant="detail", ext="jpg"):
+        """True if a variant is stored and is a whole image (see check_image)."""
+        try:
+            with open(self.path(digest, variant, ext), "rb") as file:
+                check_image(file.read(), ext)
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def put(self, data, digest=None, variant="detail", ext="jpg", repair=False):
+        """
+        Write an image variant (atomically; a no-op if it already exists).
+        Args:
+            repair: Overwrite an existing file that is not a whole image,
+                for an image whose set of variants is not complete yet
+                (and so not served). Valid files are never replaced.
+        Returns:
+            The digest of the image.
+        """
+        digest = digest or digest_of(data)
+        path = self.path(digest, variant, ext)
+        if os.path.exists(path) and not (repair and not self.is_valid(digest, variant, ext)):
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+        return digest
+
+    def remove(self, digest):
+        """Delete every variant of an image (a no-op if it is not stored)."""
+        directory = os.path.dirname(self.path(digest))
+        shutil.rmtree(directory, ignore_errors=True)
+        try:
+            # The two-letter fan-out directory, once empty
+            os.rmdir(os.path.dirname(directory))
+        except OSError:
+            pass
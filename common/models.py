@@ -7,16 +7,30 @@ Description: Defines the RSSItem and Prompt classes for database
 interactions and low-level processing.
 """
 
-from sqlalchemy import create_engine, Column, Text, String, DateTime, Integer, Boolean
+from sqlalchemy import create_engine, Column, Text, String, DateTime, Integer, Float, Boolean, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.types import JSON
+from sqlalchemy.types import JSON, LargeBinary, TypeDecorator
 from datetime import datetime
 import numpy as np
 import base64
 
+import vectors
+
 Base = declarative_base()
 
 
+class Embedding(TypeDecorator):
+    """Embedding stored as a binary blob (see common/vectors.py)."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, (bytes, bytearray)):
+            return value or None
+        return vectors.pack(value)
+
+
 class Prompt(Base):
     __tablename__ = "prompt"
 
@@ -30,11 +44,16 @@ class Prompt(Base):
     lastused_at = Column(DateTime, default=datetime.utcnow)
     key = Column(Text(8), nullable=False)
     tags = Column(JSON, nullable=True, default=[])
-    embedding = Column(JSON, nullable=True, default=[])
-    feed = Column(JSON, nullable=True, default=[])
+    embedding = Column(Embedding, nullable=True, default=None)
+    # The feed itself is stored in the prompt_feed table (see PromptFeed)
     settings = Column(JSON, nullable=True, default=[])
-    ner_count = Column(Integer, nullable=True, default=0)
+    ner_count = Column(Integer, nullable=True, default=0, index=True)
     enable = Column(Boolean, nullable=True, default=True)
+    # Articles embedded after this time have not been scored for the feed yet
+    scored_at = Column(DateTime, nullable=True)
+    # NER worker holding the prompt until lease_until (see /ner/{type}/claim)
+    leased_by = Column(String, nullable=True)
+    lease_until = Column(DateTime, nullable=True)
 
 
     def __init__(
@@ -47,10 +66,10 @@ class Prompt(Base):
         created_at=None,
         lastused_at=None,
         embedding=None,
-        feed=None,
         settings=None,
         ner_count=None,
         enable=None,
+        scored_at=None,
     ):
         self.uuid = uuid
         self.text = text
@@ -59,15 +78,21 @@ class Prompt(Base):
         self.tags = tags or []
         self.created_at = created_at or datetime.utcnow()
         self.lastused_at = lastused_at or datetime.utcnow()
-        self.embedding = embedding or []
-        self.feed = feed or []
+        self.embedding = embedding
         self.settings = settings or []
         self.ner_count = ner_count or 0
         self.enable = enable or True
+        self.scored_at = scored_at
 
 
 class RSSItem(Base):
     __tablename__ = "rss_items"
+    __table_args__ = (
+        # Keyset pages: ORDER BY pubDate DESC, uuid DESC after a (pubDate, uuid) cursor
+        Index("ix_rss_items_pubDate_uuid", "pubDate", "uuid"),
+        # Category pages: WHERE categorie = ? and the same order
+        Index("ix_rss_items_categorie_pubDate_uuid", "categorie", "pubDate", "uuid"),
+    )
 
     uuid = Column(Text(24), primary_key=True, index=True, nullable=False)
     link = Column(String, unique=True, nullable=False)
@@ -78,11 +103,15 @@ class RSSItem(Base):
     image = Column(Text, nullable=True)
     source = Column(String, nullable=False)
     categorie = Column(String, nullable=False)
-    frontpage_id = Column(Integer, nullable=True, default=0)
+    frontpage_id = Column(Integer, nullable=True, default=0, index=True)
     tags = Column(JSON, nullable=True, default=[])
-    embedding = Column(JSON, nullable=True, default=[])
+    embedding = Column(Embedding, nullable=True, default=None)
     similar = Column(JSON, nullable=True, default=[])
-    ner_count = Column(Integer, nullable=True, default=0)
+    ner_count = Column(Integer, nullable=True, default=0, index=True)
+    embedded_at = Column(DateTime, nullable=True)
+    # NER worker holding the article until lease_until (see /ner/{type}/claim)
+    leased_by = Column(String, nullable=True)
+    lease_until = Column(DateTime, nullable=True)
 
 
     def __init__(
@@ -101,6 +130,7 @@ class RSSItem(Base):
         embedding=None,
         similar=None,
         ner_count=None,
+        embedded_at=None,
     ):
         self.uuid = uuid
         self.link = link
@@ -113,10 +143,72 @@ class RSSItem(Base):
         self.frontpage_id = frontpage_id if frontpage_id is not None else 0
         self.tags = tags or []
         self.description = description
-        self.embedding = embedding or []
+        self.embedding = embedding
         self.similar = similar or []
         self.ner_count = ner_count or 0
+        self.embedded_at = embedded_at
 
 
     def set_image(self, image_binary):
         self.image = base64.b64encode(image_binary).decode('utf-8')
+
+
+class Entity(Base):
+    """A normalized NER entity, interned to an integer id."""
+
+    __tablename__ = "entity"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, unique=True, nullable=False)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class EntityPosting(Base):
+    """Inverted index: one row per (entity, article) pair."""
+
+    __tablename__ = "entity_posting"
+
+    entity_id = Column(Integer, ForeignKey("entity.id"), primary_key=True)
+    article_uuid = Column(
+        Text(24), ForeignKey("rss_items.uuid"), primary_key=True, index=True
+    )
+
+    def __init__(self, entity_id, article_uuid):
+        self.entity_id = entity_id
+        self.article_uuid = article_uuid
+
+
+class PromptFeed(Base):
+    """Feed of a prompt: one row per matching article, with its score."""
+
+    __tablename__ = "prompt_feed"
+    __table_args__ = (
+        # Feed pages: WHERE prompt_uuid = ? ORDER BY score|pubDate DESC, article_uuid DESC
+        Index("ix_prompt_feed_prompt_score", "prompt_uuid", "score", "article_uuid"),
+        Index("ix_prompt_feed_prompt_pubDate", "prompt_uuid", "pubDate", "article_uuid"),
+    )
+
+    prompt_uuid = Column(Text(24), ForeignKey("prompt.uuid"), primary_key=True)
+    article_uuid = Column(
+        Text(24), ForeignKey("rss_items.uuid"), primary_key=True, index=True
+    )
+    score = Column(Float, nullable=False)
+    # Copy of the article pubDate, so date-ordered pages never sort the join
+    pubDate = Column(DateTime, nullable=False)
+
+    def __init__(self, prompt_uuid, article_uuid, score, pubDate):
+        self.prompt_uuid = prompt_uuid
+        self.article_uuid = article_uuid
+        self.score = score
+        self.pubDate = pubDate
+
+
+class Meta(Base):
+    """Key/value counters shared with the frontend (see database.bump_data_version)."""
+
+    __tablename__ = "meta"
+
+    key = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
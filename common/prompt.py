@@ -6,9 +6,12 @@ Module Name: common/prompt.py
 Description: PromptClient class for interacting with the Prompt Item API.
 """
 
+import copy
+import json
 import requests
 import os
 from config import *
+import vectors
 import numpy as np
 import re
 
@@ -29,6 +32,7 @@ class PromptClient:
         settings=None,
         ner_count=None,
         enable=None,
+        fields=None,
     ):
         self.uuid = uuid
         self.text = text
@@ -42,9 +46,11 @@ class PromptClient:
         self.settings = settings or []
         self.ner_count = ner_count or 0
         self.enable = enable or True
+        # Values as last read from or written to the API (see changed_fields)
+        self._saved = None
 
         if uuid:
-            self.get()
+            self.get(fields)
 
     def create(self):
         """Create a new Prompt via the API (POST)."""
@@ -55,26 +61,89 @@ class PromptClient:
         else:
             print(f"Failed to create Prompt: {response.text}")
 
-    def update(self):
-        """Update the existing Prompt via the API (PUT)."""
+    def changed_fields(self):
+        """Names of the fields changed since get() (every field if it was never read)."""
+        data = self.to_dict()
+        del data["uuid"]
+        if self._saved is None:
+            return list(data)
+        return [field for field, value in data.items() if value != self._saved.get(field)]
+
+    def mark_clean(self, fields=None):
+        """Record the current value of some fields (all by default) as saved."""
+        data = self.to_dict()
+        if self._saved is None:
+            self._saved = {}
+        for field in data if fields is None else fields:
+            self._saved[field] = copy.deepcopy(data[field])
+
+    def update(self, fields=None):
+        """
+        Save the changes of the Prompt via the API (PATCH).
+        Only the fields changed since get() are sent.
+        Args:
+            fields: Optional names of the fields to send instead.
+        """
         if not self.uuid:
             raise ValueError("UUID is required to update a prompt.")
+        fields = list(fields or self.changed_fields())
+        if not fields:
+            return
         api_url = f"{LNQ_API_URL}:{LNQ_API_PORT}/prompt/{self.uuid}/{self.key}"
-        response = requests.put(api_url, json=self.to_dict())
+        data = self.to_dict()
+        response = requests.patch(api_url, json={field: data[field] for field in fields})
         if response.status_code == 200:
+            self.mark_clean(fields)
             print("Prompt updated successfully.")
         else:
             print(f"Failed to update Prompt: {response.text}")
 
-    def get(self):
-        """Retrieve a Prompt from the API (GET)."""
+    @classmethod
+    def fetch_many(cls, uuids=None, fields=None):
+        """
+        Retrieve many Prompts with a single API call (POST /bulk/prompts).
+        The backend streams one JSON object per line (NDJSON).
+        Args:
+            uuids: The items to retrieve (in this order), or None for every
+                item that has tags or an embedding.
+            fields: Optional names of the fields to download (all by default).
+
+        Returns:
+            A list of PromptClient, or an empty list on failure.
+        """
+        api_url = f"{LNQ_API_URL}:{LNQ_API_PORT}/bulk/prompts"
+        params = {"fields": ",".join(fields)} if fields else None
+        body = {"uuids": list(uuids)} if uuids is not None else {}
+        items = []
+        try:
+            with requests.post(api_url, json=body, params=params, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line:
+                        item = cls()
+                        item.from_dict(json.loads(line))
+                        item.mark_clean()
+                        items.append(item)
+        except requests.RequestException as e:
+            print(f"Failed to get Prompts: {e}")
+            return []
+        return items
+
+    def get(self, fields=None):
+        """
+        Retrieve a Prompt from the API (GET).
+        Args:
+            fields: Optional names of the fields to download (all by default).
+        """
         if not self.uuid:
             raise ValueError("UUID is required to get a prompt.")
         api_url = f"{LNQ_API_URL}:{LNQ_API_PORT}/prompt/{self.uuid}"
-        response = requests.get(api_url)
+        params = {"fields": ",".join(fields)} if fields else None
+        response = requests.get(api_url, params=params)
         if response.status_code == 200:
             data = response.json()
             self.from_dict(data)
+            self.mark_clean()
             print("Prompt retrieved successfully.")
             print(data)
         else:
@@ -90,7 +159,7 @@ class PromptClient:
             "tags": self.tags,
             "created_at": self.created_at,
             "lastused_at": self.lastused_at,
-            "embedding": self.embedding,
+            "embedding": vectors.to_api(self.embedding),
             "feed": self.feed,
             "settings": self.settings,
             "ner_count": self.ner_count,
@@ -106,7 +175,8 @@ class PromptClient:
         self.tags = data.get("tags", [])
         self.created_at = data.get("created_at")
         self.lastused_at = data.get("lastused_at")
-        self.embedding = data.get("embedding", [])
+        embedding = vectors.from_api(data.get("embedding"))
+        self.embedding = vectors.unpack(embedding) if embedding else []
         self.feed = data.get("feed", [])
         self.settings = data.get("settings", [])
         self.ner_count = data.get("ner_count", 0)
@@ -120,7 +190,7 @@ class PromptClient:
 
     def search(self):
         """Search for Articles using the embedding. Return > 1.5"""
-        if not self.embedding:
+        if len(self.embedding) == 0:
             raise ValueError("Embedding is required to search for articles that matche me.")
         api_url = f"{LNQ_API_URL}:{LNQ_API_PORT}/search/{self.uuid}"
         response = requests.get(api_url)
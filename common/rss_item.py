@@ -7,11 +7,13 @@ Description: RSSItemClient class for interacting with the RSS Item class
 and Backend API.
 """
 
+import copy
 import json
 import requests
 import os
 import re
 from config import *
+import vectors
 
 class RSSItemClient:
 
@@ -31,6 +33,7 @@ class RSSItemClient:
         embedding=None,
         similar=None,
         ner_count=None,
+        fields=None,
     ):
         self.uuid = uuid
         self.link = link
@@ -46,9 +49,11 @@ class RSSItemClient:
         self.embedding = embedding or []
         self.similar = similar or []
         self.ner_count = ner_count or 0
+        # Values as last read from or written to the API (see changed_fields)
+        self._saved = None
 
         if uuid:
-            self.get()
+            self.get(fields)
 
     def __str__(self, sanitized=True):
         """Convert the RSSItem to a string representation, optionally sanitizing the title and description."""
@@ -74,7 +79,7 @@ class RSSItemClient:
             "categorie": self.categorie,
             "frontpage_id": self.frontpage_id if self.frontpage_id is not None else 0,
             "tags": self.tags,
-            "embedding": self.embedding,
+            "embedding": vectors.to_api(self.embedding),
             "similar": self.similar,
             "ner_count": self.ner_count,
         }
@@ -92,7 +97,8 @@ class RSSItemClient:
         self.categorie = data.get("categorie")
         self.frontpage_id = data.get("frontpage_id", 0)
         self.tags = data.get("tags", [])
-        self.embedding = data.get("embedding", [])
+        embedding = vectors.from_api(data.get("embedding"))
+        self.embedding = vectors.unpack(embedding) if embedding else []
         self.similar = data.get("similar", [])
         self.ner_count = data.get("ner_count", 0)
 
@@ -105,26 +111,106 @@ class RSSItemClient:
         else:
             print(f"Failed to create RSS Item: {response.status_code} {response.text}")
 
-    def update(self):
-        """Update the existing RSSItem via the API (PUT)."""
+    @classmethod
+    def create_many(cls, items):
+        """
+        Create many RSSItems with a single API call (POST).
+        Returns:
+            One {"link", "uuid", "status"} per item ("created" or "duplicate"),
+            or None on failure.
+        """
+        if not items:
+            return []
+        api_url = f"{LNQ_API_URL}:{LNQ_API_PORT}/rss-items/batch"
+        response = requests.post(api_url, json=[item.to_dict() for item in items])
+        if response.status_code == 200:
+            return response.json()
+        print(f"Failed to create RSS Items: {response.status_code} {response.text}")
+        return None
+
+    def changed_fields(self):
+        """Names of the fields changed since get() (every field if it was never read)."""
+        data = self.to_dict()
+        del data["uuid"]
+        if self._saved is None:
+            return list(data)
+        return [field for field, value in data.items() if value != self._saved.get(field)]
+
+    def mark_clean(self, fields=None):
+        """Record the current value of some fields (all by default) as saved."""
+        data = self.to_dict()
+        if self._saved is None:
+            self._saved = {}
+        for field in data if fields is None else fields:
+            self._saved[field] = copy.deepcopy(data[field])
+
+    def update(self, fields=None):
+        """
+        Save the changes of the RSSItem via the API (PATCH).
+        Only the fields changed since get() are sent.
+        Args:
+            fields: Optional names of the fields to send instead.
+        """
         if not self.uuid:
             raise ValueError("UUID is required to update an RSS item.")
+        fields = list(fields or self.changed_fields())
+        if not fields:
+            return
         api_url = f"{LNQ_API_URL}:{LNQ_API_PORT}/rss-item/{self.uuid}"
-        response = requests.put(api_url, json=self.to_dict())
+        data = self.to_dict()
+        response = requests.patch(api_url, json={field: data[field] for field in fields})
         if response.status_code == 200:
+            self.mark_clean(fields)
             print("RSS Item updated successfully.")
         else:
             print(f"Failed to update RSS Item: {response.status_code} {response.text}")
 
-    def get(self):
-        """Retrieve an RSSItem from the API (GET)."""
+    @classmethod
+    def fetch_many(cls, uuids=None, fields=None):
+        """
+        Retrieve many RSSItems with a single API call (POST /bulk/articles).
+        The backend streams one JSON object per line (NDJSON).
+        Args:
+            uuids: The items to retrieve (in this order), or None for every
+                item that has tags or an embedding.
+            fields: Optional names of the fields to download (all by default).
+
+        Returns:
+            A list of RSSItemClient, or an empty list on failure.
+        """
+        api_url = f"{LNQ_API_URL}:{LNQ_API_PORT}/bulk/articles"
+        params = {"fields": ",".join(fields)} if fields else None
+        body = {"uuids": list(uuids)} if uuids is not None else {}
+        items = []
+        try:
+            with requests.post(api_url, json=body, params=params, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line:
+                        item = cls()
+                        item.from_dict(json.loads(line))
+                        item.mark_clean()
+                        items.append(item)
+        except requests.RequestException as e:
+            print(f"Failed to get RSSItems: {e}")
+            return []
+        return items
+
+    def get(self, fields=None):
+        """
+        Retrieve an RSSItem from the API (GET).
+        Args:
+            fields: Optional names of the fields to download (all by default).
+        """
         if not self.uuid:
             raise ValueError("UUID is required to get an RSS item.")
         api_url = f"{LNQ_API_URL}:{LNQ_API_PORT}/rss-item/{self.uuid}"
-        response = requests.get(api_url)
+        params = {"fields": ",".join(fields)} if fields else None
+        response = requests.get(api_url, params=params)
         if response.status_code == 200:
             data = response.json()
             self.from_dict(data)
+            self.mark_clean()
             print("RSS Item retrieved successfully.")
         else:
             print(f"Failed to get RSS Item: {response.text}")
@@ -8,10 +8,12 @@ Description:
 
 import requests
 import config
-from typing import List
+from typing import List, Optional, Tuple
+import time
 import os
 import re
 import logging
+import unicodedata
 import numpy as np
 
 
@@ -32,6 +34,24 @@ def fetch_all(endpoint: str) -> List[str]:
         print(f"Error fetching {endpoint}: {e}")
         return []
 
+def fetch_links(hours: int = 48) -> List[dict]:
+    """
+    Retrieves the links of the articles published in the last hours.
+    Args:
+        hours (int): Size of the window.
+
+    Returns:
+        List[dict]: A list of {"link", "pubDate"} or an empty list on failure.
+    """
+    url = f"{config.LNQ_BASE_URL}/links"
+    try:
+        response = requests.get(url, params={"hours": hours})
+        response.raise_for_status()
+        return response.json()
+    except requests.RequestException as e:
+        print(f"Error fetching links: {e}")
+        return []
+
 def fetch_items_no_ner(endpoint: str) -> List[str]:
     """
     Retrieves a list of items for NER and embedding processing.
@@ -52,6 +72,36 @@ def fetch_items_no_ner(endpoint: str) -> List[str]:
         return []
 
 
+def claim_items_for_ner(
+    endpoint: str, worker: str, limit: int = 10, stage: Optional[str] = None
+) -> List[str]:
+    """
+    Leases a batch of items for NER and embedding processing to a worker.
+    The lease is released when the item is updated with its ner_count.
+    Args:
+        endpoint (str): The API endpoint (e.g., 'articles', 'prompts').
+        worker (str): The worker id holding the lease.
+        limit (int): Maximum number of items.
+        stage (str): 'ner' or 'enrich' to only claim the articles needing
+            that stage; both by default.
+
+    Returns:
+        List[str]: A list of item IDs or an empty list on failure.
+    """
+    url = f"{config.LNQ_BASE_URL}/ner/{endpoint}/claim"
+
+    try:
+        params = {"worker": worker, "limit": limit}
+        if stage:
+            params["stage"] = stage
+        response = requests.post(url, params=params)
+        response.raise_for_status()
+        return response.json()
+    except requests.RequestException as e:
+        print(f"Error claiming {endpoint}: {e}")
+        return []
+
+
 def fetch_items_no_similar() -> List[str]:
     """
     Retrieves a list of articles for SIMILAR processing.
@@ -71,6 +121,126 @@ def fetch_items_no_similar() -> List[str]:
         return []
 
 
+def refresh_feeds() -> int:
+    """
+    Asks the backend to rebuild the feed of every active prompt.
+    Returns:
+        int: The number of prompts refreshed, 0 on failure.
+    """
+    url = f"{config.LNQ_BASE_URL}/feeds/refresh"
+
+    try:
+        response = requests.post(url)
+        response.raise_for_status()
+        return response.json()["prompts"]
+    except requests.RequestException as e:
+        print(f"Error refreshing feeds: {e}")
+        return 0
+
+
+def has_image(digest: str) -> bool:
+    """
+    Checks whether every variant of an image is already in the image store.
+    Args:
+        digest (str): The image digest (see image_store).
+
+    Returns:
+        bool: True if the image is stored, False if not or on failure.
+    """
+    url = f"{config.LNQ_BASE_URL}/images/{digest}"
+
+    try:
+        return requests.get(url).status_code == 200
+    except requests.RequestException as e:
+        print(f"Error checking image {digest}: {e}")
+        return False
+
+
+def put_image(digest: str, variant: str, ext: str, data: bytes) -> bool:
+    """
+    Uploads a rendered image to the backend image store.
+    Args:
+        digest (str): sha256 digest of the image (see image_store).
+        variant (str): The image variant ('card' or 'detail').
+        ext (str): The file extension ('webp' or 'jpg').
+        data (bytes): The encoded image.
+
+    Returns:
+        bool: True if the image is stored.
+    """
+    url = f"{config.LNQ_BASE_URL}/images/{digest}/{variant}.{ext}"
+
+    try:
+        response = requests.put(url, data=data, headers={"Content-Type": "application/octet-stream"})
+        response.raise_for_status()
+        return True
+    except requests.RequestException as e:
+        print(f"Error uploading image {digest}: {e}")
+        return False
+
+
+def wait_events(
+    since: Optional[Tuple[str, int]], types: List[str], timeout: float = 25
+) -> Tuple[Optional[Tuple[str, int]], List[dict]]:
+    """
+    Waits for backend change events (long-poll), so a worker can sleep until
+    there is work. Returns after at most `timeout` seconds either way, which
+    keeps polling as a fallback. When events may have been missed (buffer
+    overflow, or the backend restarted), returns right away with a single
+    {"type": "reset"} event: the caller must look for work.
+    Args:
+        since (Optional[Tuple[str, int]]): Cursor (backend epoch, sequence
+            number) returned by the previous call, None on the first call.
+        types (List[str]): Event types to wait for (e.g., 'article.created').
+        timeout (float): Maximum wait in seconds.
+
+    Returns:
+        Tuple[Optional[Tuple[str, int]], List[dict]]: The cursor for the next
+        call and the events received (empty on timeout or failure).
+    """
+    url = f"{config.LNQ_BASE_URL}/events"
+    params = {"types": ",".join(types), "timeout": timeout}
+    if since is not None:
+        params["epoch"], params["since"] = since
+
+    try:
+        response = requests.get(url, params=params, timeout=timeout + 10)
+        response.raise_for_status()
+        data = response.json()
+        cursor = (data["epoch"], data["seq"])
+        if data.get("reset"):
+            return cursor, [{"seq": data["seq"], "type": "reset", "uuid": None}]
+        return cursor, data["events"]
+    except (requests.RequestException, KeyError, ValueError) as e:
+        print(f"Error waiting for events: {e}")
+        time.sleep(timeout)
+        return since, []
+
+
+def normalize_entity(name: str) -> str:
+    """
+    Normalizes a NER entity for matching.
+    Removes the "▁" subword marker, folds case and accents and collapses
+    whitespace, so that "▁Québec" and "quebec" are the same entity.
+    Args:
+        name (str): The entity as returned by the NER model.
+
+    Returns:
+        str: The normalized entity, possibly empty.
+    """
+    name = unicodedata.normalize("NFKD", name.replace("▁", " "))
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    name = re.sub(r"\s+", " ", name).strip(" .,;:!?'\"()[]«»-")
+    return name.casefold()
+
+
+def entity_names(tags) -> List[str]:
+    """Returns the distinct normalized entities of a list of NER tags."""
+    names = {normalize_entity(tag["entity"]) for tag in tags or [] if tag.get("entity")}
+    names.discard("")
+    return sorted(names)
+
+
 def calculate_ner(a_tags, b_tags):
     """
     Calculates the number of common NER tags.
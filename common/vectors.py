@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: common/vectors.py
+Description: Compact binary encoding of embeddings. A vector is stored as
+a small header (magic, version, dtype, dimension) followed by the raw
+little-endian float32 or float16 values. The API carries the same blob as
+a URL-safe base64 string (the encoding pydantic uses for bytes fields).
+"""
+
+import base64
+import binascii
+import json
+import struct
+import numpy as np
+
+import config
+
+MAGIC = b"LNQE"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHI")  # magic, version, dtype, reserved, dimension
+DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+DTYPE_CODES = {"float32": 1, "float16": 2}
+
+
+def pack(vector, dtype=None):
+    """
+    Encode a vector as a binary blob.
+    Args:
+        vector: A list or numpy array of floats.
+        dtype (str): 'float32' or 'float16', defaults to LNQ_EMBEDDING_DTYPE.
+
+    Returns:
+        bytes, or None when the vector is empty.
+    """
+    if vector is None:
+        return None
+    array = np.asarray(vector, dtype=np.float32).ravel()
+    if array.size == 0:
+        return None
+    code = DTYPE_CODES.get(dtype or config.LNQ_EMBEDDING_DTYPE)
+    if code is None:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+    header = HEADER.pack(MAGIC, VERSION, code, 0, array.size)
+    return header + array.astype(DTYPES[code]).tobytes()
+
+
+def unpack(blob):
+    """
+    Decode a binary blob produced by pack().
+    Returns:
+        A float32 numpy array.
+    """
+    if len(blob) < HEADER.size:
+        raise ValueError("Embedding blob is shorter than its header")
+    magic, version, code, _, dim = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION or code not in DTYPES:
+        raise ValueError("Invalid embedding blob header")
+    if len(blob) < HEADER.size + dim * DTYPES[code].itemsize:
+        raise ValueError(f"Embedding blob is too short for {dim} values")
+    array = np.frombuffer(blob, dtype=DTYPES[code], count=dim, offset=HEADER.size)
+    return array.astype(np.float32)
+
+
+def to_array(value):
+    """Return a float32 vector from a blob, a list or an array (None if empty)."""
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return unpack(bytes(value)) if len(value) else None
+    array = np.asarray(value, dtype=np.float32).ravel()
+    return array if array.size else None
+
+
+def to_api(value):
+    """Encode a vector (or blob) as a base64 string for JSON payloads."""
+    if value is None:
+        return None
+    if not isinstance(value, (bytes, bytearray)):
+        value = pack(value)
+        if value is None:
+            return None
+    return base64.urlsafe_b64encode(value).decode("ascii")
+
+
+def from_api(value):
+    """
+    Decode an embedding received from the API into a blob.
+    Args:
+        value: A base64 string, a legacy JSON list of floats, or None.
+
+    Returns:
+        bytes, or None when the embedding is empty.
+    """
+    if value is None or (isinstance(value, (str, list)) and len(value) == 0):
+        return None
+    if isinstance(value, str):
+        try:
+            # Accept both the URL-safe and the standard alphabet
+            blob = base64.b64decode(value, altchars=b"-_", validate=True)
+        except binascii.Error:
+            raise ValueError("Embedding is not valid base64")
+        unpack(blob)
+        return blob
+    return pack(value)
+
+
+def from_legacy(text):
+    """Convert a legacy JSON-encoded embedding column value into a blob."""
+    if not text:
+        return None
+    return pack(json.loads(text))
@@ -9,12 +9,15 @@ backend API.
 """
 
 import os
+import sys
+import time
 import pytz
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import requests
 
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy import create_engine, Column, Integer, Float, String, Text, DateTime, JSON, func, tuple_
 from flask import (
     Flask,
     render_template,
@@ -24,13 +27,20 @@ from flask import (
     url_for,
     abort,
     jsonify,
+    make_response,
+    send_file,
 )
 from flask_wtf import FlaskForm, CSRFProtect
 from flask_bootstrap import Bootstrap5, SwitchField
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import declarative_base, deferred, load_only
 import requests
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../common")))
+import database
+import image_store
+from page_cache import PageCache, release_fingerprint
+
 montreal_tz = pytz.timezone("America/Toronto")
 
 Base = declarative_base()
@@ -42,7 +52,12 @@ app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev")
 
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}?mode=ro"
+app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///file:{db_path}?mode=ro&uri=true"
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    "pool_size": database.LNQ_DB_POOL_SIZE,
+    "max_overflow": database.LNQ_DB_MAX_OVERFLOW,
+    "connect_args": {"check_same_thread": False},
+}
 
 # set default button sytle and size, will be overwritten by macro parameters
 app.config["BOOTSTRAP_BTN_STYLE"] = "primary"
@@ -54,12 +69,43 @@ app.config["BOOTSTRAP_TABLE_EDIT_TITLE"] = "Update"
 app.config["BOOTSTRAP_TABLE_DELETE_TITLE"] = "Remove"
 app.config["BOOTSTRAP_TABLE_NEW_TITLE"] = "Create"
 
+images = image_store.ImageStore(image_store.default_root(db_path))
+# Images are content-addressed: a URL always serves the same bytes
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
 bootstrap = Bootstrap5(app)
 db = SQLAlchemy(app)
+with app.app_context():
+    if database.LNQ_DB_PROFILE == "production":
+        database.register_pragmas(db.engine, readonly=True)
 csrf = CSRFProtect(app)
 
+
+def read_data_version():
+    with db.engine.connect() as connection:
+        return database.read_data_version(connection)
+
+
+# Pages are also invalidated when a deploy changes the templates or static files
+page_cache = PageCache(
+    read_data_version,
+    release_fingerprint(
+        os.path.join(app.root_path, app.template_folder),
+        app.static_folder,
+    ),
+)
+# The backend records at most one view per hour and prompt
+PROMPT_TOUCH_INTERVAL = 3600
+_touched = {}
+_toucher = ThreadPoolExecutor(1, thread_name_prefix="touch")
+# Articles per category, at a data version (see article_counts)
+_counts = {"version": None, "counts": {}}
+
 ITEMS_PER_PAGE = 15
 
+# Orders of a prompt feed page: sort key column name
+FEED_ORDERS = ("date", "score")
+
 valid_categories = {
     "international": {"name": "International", "color": "#4a90e2"},
     "politique": {"name": "Politique", "color": "#e74c3c"},
@@ -92,6 +138,85 @@ def read_settings(data):
     settings = [{key: value} for key, value in data.items() if key not in ("csrf_token", "prompt")]
     return text, settings
 
+@app.template_filter("image_src")
+def image_src(image, variant="detail", ext="jpg"):
+    """URL of an article image: store digest, or a legacy data: URL as is."""
+    if image_store.is_digest(image):
+        return url_for("image", digest=image, variant=variant, ext=ext)
+    return image
+
+app.add_template_test(image_store.is_digest, "image_digest")
+
+def cached_render(render, *args):
+    """
+    Rendered page from the page cache, keyed by the URL and valid for the
+    current data version and release. Browsers revalidate with the ETag and
+    get a 304 Not Modified while both are unchanged.
+    """
+    version = page_cache.version()
+    if version is None:
+        return render(*args)
+    key = (request.path, tuple(sorted(request.args.items(multi=True))))
+    etag = page_cache.etag(key, version)
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        body = page_cache.get(key, version)
+        if body is None:
+            body = render(*args)
+            page_cache.put(key, version, body)
+        response = make_response(body)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+def _post_touch(uuid):
+    try:
+        requests.post(f"http://127.0.0.1:8000/prompt/{uuid}/touch", timeout=1)
+    except requests.exceptions.RequestException:
+        pass
+
+def touch_prompt(uuid):
+    """
+    Keep a prompt from being expired by the backend retention. The request
+    is sent from a background thread, so a page never waits for the backend.
+    """
+    now = time.monotonic()
+    if now - _touched.get(uuid, -PROMPT_TOUCH_INTERVAL) < PROMPT_TOUCH_INTERVAL:
+        return
+    if len(_touched) > 10000:
+        _touched.clear()
+    _touched[uuid] = now
+    _toucher.submit(_post_touch, uuid)
+
+def article_counts():
+    """Number of articles per category, counted again only when the data version changes."""
+    version = page_cache.version()
+    if version is not None and version == _counts["version"]:
+        return _counts["counts"]
+    counts = dict(
+        db.session.query(RSSItem.categorie, func.count(RSSItem.uuid))
+        .group_by(RSSItem.categorie)
+        .all()
+    )
+    if version is not None:
+        _counts.update(version=version, counts=counts)
+    return counts
+
+def encode_cursor(value, uuid):
+    """Keyset cursor of a row: its sort key and uuid."""
+    value = value.isoformat() if isinstance(value, datetime) else repr(value)
+    return f"{value}~{uuid}"
+
+def decode_cursor(cursor, order):
+    """(sort key, uuid) of a cursor, or None if it is missing or malformed."""
+    try:
+        value, uuid = cursor.rsplit("~", 1)
+        value = datetime.fromisoformat(value) if order == "date" else float(value)
+    except (AttributeError, ValueError):
+        return None
+    return value, uuid
+
 class RSSItem(db.Model):
     __tablename__ = "rss_items"
 
@@ -103,8 +228,9 @@ class RSSItem(db.Model):
     source = Column(String, nullable=False)
     categorie = Column(String, nullable=False)
     frontpage_id = Column(Integer, nullable=False)
-    similar = Column(JSON, nullable=True, default=[])
-    image = Column(Text, nullable=True)
+    # Only loaded by the views that render them (see CARD_COLUMNS)
+    similar = deferred(Column(JSON, nullable=True, default=[]))
+    image = deferred(Column(Text, nullable=True))
 
 
 class Prompt(db.Model):
@@ -116,24 +242,57 @@ class Prompt(db.Model):
     lastused_at = Column(DateTime, nullable=True)
     key = Column(Text(8), nullable=False)
     tags = Column(JSON, nullable=True, default=[])
-    embedding = Column(JSON, nullable=True, default=[])
-    feed = Column(JSON, nullable=True, default=[])
+
+
+class PromptFeed(db.Model):
+    __tablename__ = "prompt_feed"
+
+    prompt_uuid = Column(Text(24), primary_key=True)
+    article_uuid = Column(Text(24), primary_key=True)
+    score = Column(Float, nullable=False)
+    pubDate = Column(DateTime, nullable=False)
+
+
+# Columns rendered by the article cards (articles-loop.html) and by the
+# text-only views (/unes, /detail); the rest of the row is never loaded
+CARD_COLUMNS = load_only(
+    RSSItem.uuid, RSSItem.link, RSSItem.title, RSSItem.description, RSSItem.pubDate,
+    RSSItem.source, RSSItem.categorie, RSSItem.image,
+)
+TEXT_COLUMNS = load_only(
+    RSSItem.uuid, RSSItem.link, RSSItem.title, RSSItem.description, RSSItem.pubDate,
+    RSSItem.source, RSSItem.categorie,
+)
 
 @app.route("/")
 @app.route("/<categorie>")
 def index(categorie=None):
     if categorie and categorie not in valid_categories:
         categorie = None
+    return cached_render(render_index, categorie)
 
-    page = request.args.get("page", 1, type=int)
+def render_index(categorie):
+    after = request.args.get("after")
+    cursor = decode_cursor(after, "date")
+    next_url = None
 
-    query = RSSItem.query
+    query = RSSItem.query.options(CARD_COLUMNS)
     if categorie:
-        query = query.filter(RSSItem.categorie.in_([categorie]))
-    pagination = query.order_by(RSSItem.pubDate.desc()).paginate(
-        page=page, per_page=ITEMS_PER_PAGE, error_out=False
+        query = query.filter(RSSItem.categorie == categorie)
+    if cursor is not None:
+        query = query.filter(tuple_(RSSItem.pubDate, RSSItem.uuid) < cursor)
+    rss_items = (
+        query.order_by(RSSItem.pubDate.desc(), RSSItem.uuid.desc())
+        .limit(ITEMS_PER_PAGE + 1)
+        .all()
     )
-    rss_items = pagination.items
+    if len(rss_items) > ITEMS_PER_PAGE:
+        rss_items = rss_items[:ITEMS_PER_PAGE]
+        last = rss_items[-1]
+        next_url = url_for(
+            "index", categorie=categorie, after=encode_cursor(last.pubDate, last.uuid)
+        )
+    counts = article_counts()
 
     data = []
     now = datetime.now(montreal_tz)
@@ -153,7 +312,6 @@ def index(categorie=None):
                 "pubDate": time_str,
                 "uuid": item.uuid,
                 "categorie": item.categorie,
-                "similar": item.similar,
                 "image": item.image
             }
         )
@@ -162,7 +320,9 @@ def index(categorie=None):
         "home.html",
         #rss_items=rss_items,
         data=data,
-        pagination=pagination,
+        total=counts.get(categorie, 0) if categorie else sum(counts.values()),
+        next_url=next_url,
+        first_url=url_for("index", categorie=categorie) if cursor is not None else None,
         selected_category=categorie,
         valid_categories=valid_categories,
     )
@@ -171,12 +331,23 @@ def index(categorie=None):
 @app.route("/prompt/<uuid>", defaults={"key": None})
 @app.route("/prompt/<uuid>/<key>")
 def prompt(uuid=None, key=None):
+    if uuid is not None:
+        touch_prompt(uuid)
+    if uuid is None or key is not None:
+        # The forms of these views carry a CSRF token: never cached
+        return render_prompt(uuid, key)
+    return cached_render(render_prompt, uuid, key)
+
+def render_prompt(uuid, key):
     data = []
     _key= None
     _uuid = None
     prompt = None
-    pagination = None
-    page = request.args.get("page", 1, type=int)
+    next_url = None
+    order = request.args.get("order", "date")
+    if order not in FEED_ORDERS:
+        order = "date"
+    cursor = decode_cursor(request.args.get("after"), order)
 
     query = Prompt.query
     if uuid:
@@ -190,49 +361,57 @@ def prompt(uuid=None, key=None):
         if key is not None:
             _key = key
 
-        if prompt.feed == []:
-            data={}
-        else:
-            query = RSSItem.query
-            if prompt and prompt.feed:
-                uuids = [item["uuid"] for item in prompt.feed]
-                query = query.filter(RSSItem.uuid.in_(uuids))
-
-            pagination = query.order_by(RSSItem.pubDate.desc()).paginate(
-                page=page, per_page=ITEMS_PER_PAGE, error_out=False
+        # One indexed join: the page of the feed, in order, after the cursor
+        sort_key = PromptFeed.pubDate if order == "date" else PromptFeed.score
+        query = (
+            db.session.query(RSSItem, PromptFeed.score, sort_key)
+            .options(CARD_COLUMNS)
+            .join(PromptFeed, PromptFeed.article_uuid == RSSItem.uuid)
+            .filter(PromptFeed.prompt_uuid == prompt.uuid)
+        )
+        if cursor is not None:
+            query = query.filter(tuple_(sort_key, PromptFeed.article_uuid) < cursor)
+        rows = (
+            query.order_by(sort_key.desc(), PromptFeed.article_uuid.desc())
+            .limit(ITEMS_PER_PAGE + 1)
+            .all()
+        )
+        if len(rows) > ITEMS_PER_PAGE:
+            rows = rows[:ITEMS_PER_PAGE]
+            next_url = url_for(
+                "prompt", uuid=uuid, key=key, order=order,
+                after=encode_cursor(rows[-1][2], rows[-1][0].uuid),
+            )
+        now = datetime.now(montreal_tz)
+
+        for item, score, _ in rows:
+            pubDate = pytz.utc.localize(item.pubDate).astimezone(montreal_tz)
+            days_ago = (now.date() - pubDate.date()).days
+
+            time_str = f"{pubDate.strftime('%H:%M')} {pubDate.strftime('%d-%m')}"
+
+            data.append(
+                {
+                    "source": item.source,
+                    "title": item.title,
+                    "description": item.description,
+                    "image": item.image,
+                    "link": item.link,
+                    "pubDate": time_str,
+                    "uuid": item.uuid,
+                    "categorie": item.categorie,
+                    "score": score,
+                }
             )
-            rss_items = pagination.items
-            now = datetime.now(montreal_tz)
-
-            for item in rss_items:
-                score = next((feed_item["score"] for feed_item in prompt.feed if feed_item["uuid"] == item.uuid), None)
-                pubDate = pytz.utc.localize(item.pubDate).astimezone(montreal_tz)
-                days_ago = (now.date() - pubDate.date()).days
-
-                time_str = f"{pubDate.strftime('%H:%M')} {pubDate.strftime('%d-%m')}"
-
-                data.append(
-                    {
-                        "source": item.source,
-                        "title": item.title,
-                        "description": item.description,
-                        "image": item.image,
-                        "link": item.link,
-                        "pubDate": time_str,
-                        "uuid": item.uuid,
-                        "categorie": item.categorie,
-                        "similar": item.similar,
-                        # Add score from prompt.feed
-                        "score": score,
-                    }
-                )
 
     return render_template(
         "prompt.html",
         data=data,
         selected_category="prompt",
         valid_categories=valid_categories,
-        pagination=pagination,
+        order=order,
+        next_url=next_url,
+        first_url=url_for("prompt", uuid=uuid, key=key, order=order) if cursor is not None else None,
         uuid=_uuid,
         prompt=prompt,
         key=_key,
@@ -241,7 +420,7 @@ def prompt(uuid=None, key=None):
 
 @app.route("/detail/<uuid>")
 def detail(uuid=None):
-    query = RSSItem.query
+    query = RSSItem.query.options(TEXT_COLUMNS)
     if uuid:
         query = query.filter(RSSItem.uuid == uuid)
     rss_item = query.first()
@@ -263,7 +442,10 @@ def detail(uuid=None):
 
 @app.route("/unes")
 def unes():
-    query = RSSItem.query.filter(RSSItem.frontpage_id > 0)
+    return cached_render(render_unes)
+
+def render_unes():
+    query = RSSItem.query.options(TEXT_COLUMNS).filter(RSSItem.frontpage_id > 0)
     rss_items = query.order_by(RSSItem.frontpage_id.asc(), RSSItem.pubDate.desc()).all()
 
     data = []
@@ -294,6 +476,26 @@ def unes():
     )
 
 
+@app.route("/img/<digest>/<variant>.<ext>")
+def image(digest, variant, ext):
+    try:
+        path, stored_ext = images.resolve(digest, variant, ext)
+    except ValueError:
+        abort(404)
+    if path is None:
+        abort(404)
+    response = send_file(
+        path,
+        mimetype=image_store.FORMATS[stored_ext],
+        etag=f"{digest}-{os.path.basename(path)}",
+        max_age=IMAGE_MAX_AGE,
+        conditional=True,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
 @app.route("/post/<action>", methods=["POST"], strict_slashes=False)
 def handle_post(action=None):
     if action and action not in valid_actions:
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: frontend/page_cache.py
+Description: In-memory LRU cache of the rendered listing pages. A page only
+changes when the backend writes, and every such write bumps the data
+version stored in the database (see common/database.py). Cached pages
+are therefore valid as long as the version is unchanged, and the version
+itself is read at most once per LNQ_PAGE_CACHE_VERSION_TTL seconds, so a
+traffic spike is served from memory without reaching SQLite. The version
+also carries a release fingerprint (LNQ_RELEASE, or the templates and
+static files), so a deploy never serves or validates markup of the
+previous one.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+LNQ_PAGE_CACHE_SIZE = int(os.getenv("LNQ_PAGE_CACHE_SIZE", "512"))
+# How long the data version read from the database is trusted
+LNQ_PAGE_CACHE_VERSION_TTL = float(os.getenv("LNQ_PAGE_CACHE_VERSION_TTL", "1"))
+# Identifier of the deployed release; the files are fingerprinted when unset
+LNQ_RELEASE = os.getenv("LNQ_RELEASE", "")
+
+
+def files_fingerprint(*roots):
+    """Digest of the paths, sizes and modification times of the files under some directories."""
+    digest = hashlib.sha1()
+    for root in roots:
+        for directory, subdirectories, names in os.walk(root):
+            subdirectories.sort()
+            for name in sorted(names):
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entry = f"{os.path.relpath(path, root)}\0{stat.st_size}\0{stat.st_mtime_ns}\n"
+                digest.update(entry.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def release_fingerprint(*roots):
+    """Callable returning LNQ_RELEASE, or the fingerprint of the files under `roots`."""
+    if LNQ_RELEASE:
+        return lambda: LNQ_RELEASE
+    return lambda: files_fingerprint(*roots)
+
+
+class PageCache:
+
+    def __init__(
+        self,
+        read_version,
+        release=None,
+        size=LNQ_PAGE_CACHE_SIZE,
+        version_ttl=LNQ_PAGE_CACHE_VERSION_TTL,
+    ):
+        """
+        Args:
+            read_version: Callable returning the current data version.
+            release: Optional callable returning the release fingerprint,
+                checked as often as the data version.
+            size: Maximum number of pages kept (least recently used are evicted).
+            version_ttl: Seconds between two reads of the data version.
+        """
+        self._read_version = read_version
+        self._release = release
+        self.size = size
+        self.version_ttl = version_ttl
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()
+        self._version = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def version(self):
+        """
+        The current version of the pages: the data version, with the release
+        fingerprint if any. None when it cannot be read (no caching).
+        """
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.version_ttl:
+            return self._version
+        try:
+            version = self._read_version()
+            if self._release is not None:
+                version = (self._release(), version)
+        except Exception as e:
+            logging.warning(f"Page cache: cannot read the data version: {e}")
+            return None
+        with self._lock:
+            self._version = version
+            self._checked_at = now
+        return version
+
+    @staticmethod
+    def etag(key, version):
+        """ETag of a page at a data version."""
+        return hashlib.sha1(repr((key, version)).encode("utf-8")).hexdigest()
+
+    def get(self, key, version):
+        """The cached body of a page, or None if missing or rendered at another version."""
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, body):
+        with self._lock:
+            self._pages[key] = (version, body)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.size:
+                self._pages.popitem(last=False)
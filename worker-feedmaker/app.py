@@ -48,20 +48,20 @@ import rss_item
 import prompt
 
 
+# Longest time between two feed refreshes (fallback polling)
+LNQ_FEEDMAKER_INTERVAL = int(os.getenv("LNQ_FEEDMAKER_INTERVAL", "30"))
+# Wait after an event so that a burst of changes is refreshed at once
+LNQ_FEEDMAKER_DEBOUNCE = float(os.getenv("LNQ_FEEDMAKER_DEBOUNCE", "2"))
+
+since = None
 while True:
-    time.sleep(5)
-    try:
-        prompts = utils.fetch_all("prompts")
-        logging.info(f"📄 Get all: {prompts}")
-    except Exception as e:
-        logging.error(f"Error fetching prompts: {e}")
-        continue
-    for uuid in prompts:
-        time.sleep(5)
-        try:
-            my_prompt = prompt.PromptClient(uuid)
-            my_prompt.search()
-            my_prompt.update()
-        except Exception as e:
-            logging.error(f"Error fetching articles: {e}")
-        continue
+    # Wake up when an article is embedded or a prompt changes
+    since, events = utils.wait_events(
+        since, ["article.embedded", "prompt.changed"], LNQ_FEEDMAKER_INTERVAL
+    )
+    if events:
+        time.sleep(LNQ_FEEDMAKER_DEBOUNCE)
+    # All prompts are scored by the backend in one batch
+    start = time.monotonic()
+    count = utils.refresh_feeds()
+    logging.info(f"📄 Refreshed {count} feeds in {time.monotonic() - start:.1f}s")
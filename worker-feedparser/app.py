@@ -4,10 +4,12 @@
 """
 Module Name: worker-feedparser/app.py
 Description: Application responsible for parsing RSS feeds and posting them to the API for storage in the database.
-It handles different HTTP response codes, including:
+Feeds are downloaded concurrently with conditional requests (see crawler.py); unchanged feeds are skipped.
+Links already posted are remembered (see seen.py) so that only new entries reach the API.
+Each feed is posted in one batch; the API reports, per article:
 
-- [200] Success: Article successfully added to the database.
-- [409] Conflict: Article already exists in the database.
+- [created] Success: Article successfully added to the database.
+- [duplicate] Conflict: Article already exists in the database.
 - [Other] HTTP Error: Displays the respective error code if any other issue occurs during the request.
 
 """
@@ -30,6 +32,8 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../comm
 import utils
 import rss_item
 import prompt
+from crawler import FeedCrawler
+from seen import SeenLinks
 
 # Setup logging configuration
 
@@ -57,9 +61,15 @@ class MLStripper(HTMLParser):
         return "".join(self.text)
 
 
-def insert_rss_feed(url, source_title, category):
-    """Post a RSS feed item to the API."""
-    feed = feedparser.parse(url)
+def insert_rss_feed(content, source_title, category):
+    """
+    Post the items of a downloaded RSS feed to the API.
+    Returns:
+        True once every new entry is stored (created or already known),
+        False if the feed must be posted again on the next sweep.
+    """
+    feed = feedparser.parse(content)
+    items = []
     for entry in feed.entries:
         pubDate = (
             datetime(*entry.published_parsed[:6])
@@ -71,36 +81,50 @@ def insert_rss_feed(url, source_title, category):
             logging.info("⏩ Item ignored - Older than 48 hours")
             continue
 
-        item = rss_item.RSSItemClient(
-            title=strip_html_tags(entry.get("title", "").strip()),
-            link=entry.get("link", "").strip(),
-            description=strip_html_tags(entry.get("description", "").strip()),
-            pubDate=pubDate.isoformat(),
-            source=source_title,
-            categorie=category,
-        )
-
-        try:
-            item.create()
-        except Exception as e:
-            logging.error(f"An error occurred while creating the item: {e}")
-        time.sleep(2)
-
+        link = entry.get("link", "").strip()
+        if link in seen_links:
+            continue
 
-with open("source.yaml", "r", encoding="utf-8") as file:
-    sources_data = yaml.safe_load(file)
+        items.append(
+            rss_item.RSSItemClient(
+                title=strip_html_tags(entry.get("title", "").strip()),
+                link=link,
+                description=strip_html_tags(entry.get("description", "").strip()),
+                pubDate=pubDate.isoformat(),
+                source=source_title,
+                categorie=category,
+            )
+        )
 
-while True:
+    # The whole feed is posted in one call
+    try:
+        results = rss_item.RSSItemClient.create_many(items)
+    except Exception as e:
+        logging.error(f"An error occurred while creating the items: {e}")
+        return False
+    if results is None:
+        return False
+    # Only the links the API reported on are stored; the others are
+    # posted again on the next sweep
+    published = {item.link: item.pubDate for item in items}
+    for result in results:
+        seen_links.add(result["link"], datetime.fromisoformat(published[result["link"]]))
+    created = sum(1 for result in results if result["status"] == "created")
+    logging.info(f"{created} created, {len(results) - created} already known")
+    return {result["link"] for result in results} >= set(published)
+
+
+def list_feeds(sources_data):
+    """Return the (url, source title, category) of every RSS feed in source.yaml."""
+    feeds = []
     for source in sources_data["sources"]:
         logging.info(f"Processing source: {source}")
         for key, details in source.items():
             logging.info(f"Checking key: {key}")
             if "rss" in details:
                 for rss in details["rss"]:
-                    rss_url = rss["url"]
-                    category = rss["category"]
-                    logging.info(f"RSS URL: {rss_url} | Category: {category}")
-                    insert_rss_feed(rss_url, details["title"], category)
+                    logging.info(f"RSS URL: {rss['url']} | Category: {rss['category']}")
+                    feeds.append((rss["url"], details["title"], rss["category"]))
             else:
                 logging.info(f"No RSS found for {details['title']}")
 
@@ -109,5 +133,34 @@ while True:
             #     for frontpage_rss in details["frontpage"]:
             #         logging.info(f"Frontpage RSS URL: {frontpage_rss} | Source: {details['title']}")
             #         set_frontpage(frontpage_rss, details["title"])
+    return feeds
+
+
+with open("source.yaml", "r", encoding="utf-8") as file:
+    sources_data = yaml.safe_load(file)
+
+crawler = FeedCrawler(
+    os.getenv("LNQ_CRAWLER_STATE", "state/validators.json"),
+    per_host=int(os.getenv("LNQ_CRAWLER_PER_HOST", "4")),
+    total=int(os.getenv("LNQ_CRAWLER_CONCURRENCY", "32")),
+)
+
+seen_links = SeenLinks(os.getenv("LNQ_SEEN_LINKS", "state/seen.json"))
+seen_links.warm(utils.fetch_links(48))
+
+while True:
+    feeds = list_feeds(sources_data)
+    start = time.monotonic()
+    results = crawler.fetch_all([url for url, _, _ in feeds])
+    logging.info(f"Fetched {len(feeds)} feeds in {time.monotonic() - start:.1f}s")
+    for (url, source_title, category), (content, validators) in zip(feeds, results):
+        if content is None:
+            continue
+        # The validators are kept only once the entries are stored, so a
+        # failed post is retried instead of being answered 304 next time
+        if insert_rss_feed(content, source_title, category):
+            crawler.remember(url, validators)
+    crawler.save()
+    seen_links.save()
 
     time.sleep(300)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: worker-feedparser/crawler.py
+Description: Concurrent RSS downloader. Feeds are fetched with asyncio and
+a bounded number of connections per host. ETag / Last-Modified validators
+are kept per feed (and saved on disk) so that unchanged feeds answer
+304 Not Modified and are not parsed again.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from urllib.parse import urlsplit
+
+import httpx
+
+USER_AGENT = "LesNouvelles.Quebec feedparser (+https://lesnouvelles.quebec)"
+
+
+class FeedCrawler:
+
+    def __init__(self, state_path, per_host=2, total=20, timeout=20.0):
+        self.state_path = state_path
+        self.per_host = per_host
+        self.total = total
+        self.timeout = timeout
+        self.validators = {}
+        self._hosts = {}
+        self.load()
+
+    def load(self):
+        """Load the validators saved by a previous run."""
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as file:
+                self.validators = json.load(file)
+        except (OSError, ValueError):
+            self.validators = {}
+
+    def save(self):
+        """Write the validators to disk (atomically)."""
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.validators, file)
+        os.replace(tmp_path, self.state_path)
+
+    def remember(self, url, validators):
+        """Keep the validators of a feed once its entries have been handled."""
+        if validators:
+            self.validators[url] = validators
+
+    async def _fetch(self, client, url):
+        host = urlsplit(url).hostname
+        semaphore = self._hosts.setdefault(host, asyncio.Semaphore(self.per_host))
+        headers = {}
+        cached = self.validators.get(url, {})
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+        async with semaphore:
+            response = await client.get(url, headers=headers)
+        if response.status_code == 304:
+            return None, None
+        response.raise_for_status()
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        return response.content, validators
+
+    async def _fetch_all(self, urls):
+        limits = httpx.Limits(
+            max_connections=self.total, max_keepalive_connections=self.total
+        )
+        async with httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            timeout=self.timeout,
+            limits=limits,
+            follow_redirects=True,
+        ) as client:
+            return await asyncio.gather(
+                *(self._fetch(client, url) for url in urls), return_exceptions=True
+            )
+
+    def fetch_all(self, urls):
+        """
+        Download many feeds concurrently.
+        Args:
+            urls: The feed URLs.
+
+        Returns:
+            One (content, validators) pair per URL. content is None when the
+            feed has not changed (304) or when the download failed.
+        """
+        self._hosts = {}
+        results = []
+        for url, result in zip(urls, asyncio.run(self._fetch_all(urls))):
+            if isinstance(result, Exception):
+                logging.error(f"Error fetching {url}: {result}")
+                result = (None, None)
+            elif result[0] is None:
+                logging.info(f"⏩ Not modified: {url}")
+            results.append(result)
+        return results
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: worker-feedparser/seen.py
+Description: Set of article links already sent to the API, so that each
+sweep only posts new entries. Links are normalized and grouped in hourly
+buckets by publication date; buckets older than the 48h window are
+dropped. The set is saved to a small JSON file between runs.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track the visitor
+TRACKING_PARAMS = ("utm_", "xtor", "fbclid", "gclid", "at_medium", "at_campaign")
+
+
+def normalize_link(link):
+    """Normalize an article link (case of scheme and host, fragment, tracking parameters)."""
+    parts = urlsplit(link.strip())
+    query = urlencode(
+        [
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not key.lower().startswith(TRACKING_PARAMS)
+        ]
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), path, query, "")
+    )
+
+
+class SeenLinks:
+
+    def __init__(self, path, window_hours=48, bucket_seconds=3600):
+        self.path = path
+        self.window = timedelta(hours=window_hours)
+        self.bucket_seconds = bucket_seconds
+        self.buckets = {}
+        self.load()
+
+    def _bucket(self, when):
+        timestamp = when.replace(tzinfo=timezone.utc).timestamp()
+        return int(timestamp // self.bucket_seconds) * self.bucket_seconds
+
+    def __contains__(self, link):
+        link = normalize_link(link)
+        return any(link in links for links in self.buckets.values())
+
+    def __len__(self):
+        return sum(len(links) for links in self.buckets.values())
+
+    def add(self, link, when):
+        """Remember a link published at `when` (naive UTC datetime)."""
+        self.buckets.setdefault(self._bucket(when), set()).add(normalize_link(link))
+
+    def expire(self, now=None):
+        """Forget the links published before the window."""
+        oldest = self._bucket((now or datetime.utcnow()) - self.window)
+        for bucket in [bucket for bucket in self.buckets if bucket < oldest]:
+            del self.buckets[bucket]
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            self.buckets = {int(bucket): set(links) for bucket, links in data.items()}
+        except (OSError, ValueError):
+            self.buckets = {}
+        self.expire()
+
+    def save(self):
+        """Write the set to disk (atomically)."""
+        self.expire()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({bucket: sorted(links) for bucket, links in self.buckets.items()}, file)
+        os.replace(tmp_path, self.path)
+
+    def warm(self, items):
+        """Add the links known by the backend ({"link", "pubDate"} dicts)."""
+        for item in items:
+            try:
+                self.add(item["link"], datetime.fromisoformat(item["pubDate"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+        self.expire()
+        logging.info(f"Seen-link cache warmed: {len(self)} links")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: worker-ner/bench_inference.py
+Description: Throughput and parity of the NER inference backends on a
+fixed French news corpus (corpus/fr_news.txt, one sanitized text per line).
+Every backend, the fp32 one included, is compared with the original
+pipeline of the worker (transformers "ner" pipeline and an unpadded forward
+pass per text): the embeddings must stay above a cosine similarity
+tolerance and the entity sets must overlap enough on average (quantized
+backends may tag a few tokens differently). The exit status is 1 when a
+backend fails the parity check.
+
+Usage: python bench_inference.py [--backends torch,onnx-int8] [--repeat 3]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+
+import numpy as np
+import torch
+from transformers import pipeline
+
+import inference
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus/fr_news.txt")
+
+# Minimum cosine similarity with the embeddings of the original pipeline
+TOLERANCES = {"torch": 0.9999, "onnx": 0.9999, "torch-int8": 0.98, "onnx-int8": 0.98}
+# Minimum mean Jaccard overlap with its entity sets
+ENTITY_OVERLAP = {"torch": 0.99, "onnx": 0.99, "torch-int8": 0.9, "onnx-int8": 0.9}
+
+
+class OriginalPipeline:
+    """The worker's inference before the backends: one text at a time."""
+
+    def __init__(self, model_name=inference.LNQ_NER_MODEL):
+        embedder = inference.NerEmbedder("torch", model_name)
+        self.tokenizer = embedder.tokenizer
+        self.model = embedder.backend.model
+        self.nlp = pipeline("ner", model=self.model, tokenizer=self.tokenizer, device=-1)
+
+    def __call__(self, texts, batch_size=None):
+        results = []
+        for text in texts:
+            tags = [
+                {"entity": result["word"].lstrip("▁"), "label": result["entity"]}
+                for result in self.nlp(text)
+            ]
+            inputs = self.tokenizer(text, return_tensors="pt", padding=True, truncation=True)
+            with torch.no_grad():
+                outputs = self.model(**inputs, output_hidden_states=True)
+            embedding = outputs.hidden_states[-1].mean(dim=1).squeeze(0).numpy()
+            results.append((tags, embedding.tolist()))
+        return results
+
+
+def load_corpus(path=CORPUS):
+    with open(path, "r", encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def entity_set(tags):
+    return {(tag["entity"], tag["label"]) for tag in tags}
+
+
+def overlap(a, b):
+    """Jaccard index of two entity sets (1.0 when both are empty)."""
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def cosine(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def benchmark(embedder, texts, repeat, batch_size):
+    embedder(texts[:batch_size], batch_size)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = embedder(texts, batch_size)
+    elapsed = time.perf_counter() - start
+    return results, len(texts) * repeat / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backends", default=",".join(inference.BACKENDS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=inference.LNQ_NER_BATCH_SIZE)
+    parser.add_argument("--corpus", default=CORPUS)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus)
+    reference, reference_rate = benchmark(
+        OriginalPipeline(), texts, args.repeat, args.batch_size
+    )
+    print(f"{'backend':<12}{'texts/s':>10}{'speedup':>10}{'entities':>10}{'min cos':>10}")
+    print(f"{'original':<12}{reference_rate:>10.1f}{1:>10.2f}{'-':>10}{'-':>10}")
+
+    failed = False
+    for backend in args.backends.split(","):
+        results, rate = benchmark(
+            inference.NerEmbedder(backend), texts, args.repeat, args.batch_size
+        )
+        mean_overlap = float(np.mean([
+            overlap(entity_set(tags), entity_set(ref_tags))
+            for (tags, _), (ref_tags, _) in zip(results, reference)
+        ]))
+        min_cosine = min(
+            cosine(embedding, ref_embedding)
+            for (_, embedding), (_, ref_embedding) in zip(results, reference)
+        )
+        ok = mean_overlap >= ENTITY_OVERLAP[backend] and min_cosine >= TOLERANCES[backend]
+        failed |= not ok
+        print(
+            f"{backend:<12}{rate:>10.1f}{rate / reference_rate:>10.2f}"
+            f"{mean_overlap:>10.3f}{min_cosine:>10.4f}  {'ok' if ok else 'FAIL'}"
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
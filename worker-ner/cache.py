@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: worker-ner/cache.py
+Description: Persistent cache of NER / embedding results, keyed by a hash
+of the model version and the sanitized text. The same wire story published
+in several feeds, a prompt saved again unchanged or a retry then skip the
+model. The cache is a small SQLite file bounded in size; the least recently
+used entries are evicted first.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+import vectors
+
+LNQ_NER_CACHE_PATH = os.getenv(
+    "LNQ_NER_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache/ner.db"),
+)
+LNQ_NER_CACHE_MAX_MB = int(os.getenv("LNQ_NER_CACHE_MAX_MB", "256"))
+
+
+class ResultCache:
+
+    def __init__(self, version, path=LNQ_NER_CACHE_PATH, max_bytes=LNQ_NER_CACHE_MAX_MB * 1024 * 1024):
+        self.version = version
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS result ("
+            " key TEXT PRIMARY KEY,"
+            " tags TEXT NOT NULL,"
+            " embedding BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " used_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_result_used_at ON result (used_at)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM result").fetchone()[0]
+
+    def key(self, text):
+        """Hash of the model version and the text (whitespace runs collapsed, as the tokenizer does)."""
+        text = " ".join(text.split())
+        return hashlib.sha256(f"{self.version}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, text):
+        """Return the cached (formatted_results, embedding) of a text, or None."""
+        key = self.key(text)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tags, embedding FROM result WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE result SET used_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        tags, embedding = row
+        return json.loads(tags), vectors.unpack(embedding).tolist()
+
+    def put(self, text, tags, embedding):
+        """Store the result of a text and evict the least recently used entries."""
+        key = self.key(text)
+        tags = json.dumps(tags, ensure_ascii=False)
+        # The cache keeps full precision whatever LNQ_EMBEDDING_DTYPE is
+        embedding = vectors.pack(embedding, "float32")
+        size = len(key) + len(tags) + len(embedding)
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT size FROM result WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO result (key, tags, embedding, size, used_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, tags, embedding, size, time.time()),
+            )
+            self._size += size - (previous[0] if previous else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM result ORDER BY used_at LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                return
+            for key, size in rows:
+                self._conn.execute("DELETE FROM result WHERE key = ?", (key,))
+                self._size -= size
+                self.evictions += 1
+                if self._size <= self.max_bytes:
+                    return
+
+    def stats(self):
+        """Counters used to size the cache."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM result").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logging.info(
+            f"NER cache: {stats['hit_rate']:.1%} hit rate ({stats['hits']} hits, "
+            f"{stats['misses']} misses), {stats['entries']} entries, "
+            f"{stats['bytes'] / 1024 / 1024:.1f}/{stats['max_bytes'] / 1024 / 1024:.0f} MB, "
+            f"{stats['evictions']} evictions"
+        )
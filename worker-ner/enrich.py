@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: worker-ner/enrich.py
+Description: Enrichment stage of worker-ner: Open Graph metadata and the
+banner image of the articles. It runs next to the model, on thread pools:
+downloads share one pooled HTTP session (keep-alive, bounded number of
+requests per host) and image rendering has its own workers, so network
+waits never stall inference.
+"""
+
+import functools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image, ImageDraw, ImageFont
+
+import utils
+from image_store import image_digest
+from ogp import fetch_ogp
+
+LNQ_ENRICH_WORKERS = int(os.getenv("LNQ_ENRICH_WORKERS", "8"))
+LNQ_ENRICH_IMAGE_WORKERS = int(os.getenv("LNQ_ENRICH_IMAGE_WORKERS", "2"))
+LNQ_ENRICH_PER_HOST = int(os.getenv("LNQ_ENRICH_PER_HOST", "2"))
+LNQ_ENRICH_TIMEOUT = float(os.getenv("LNQ_ENRICH_TIMEOUT", "15"))
+LNQ_ENRICH_KNOWN_IMAGES = int(os.getenv("LNQ_ENRICH_KNOWN_IMAGES", "4096"))
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36"
+}
+
+
+def new_session(per_host=LNQ_ENRICH_PER_HOST, hosts=64):
+    """HTTP session keeping `per_host` connections alive for up to `hosts` hosts."""
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=hosts, pool_maxsize=per_host)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_ogp(link, session=None):
+    """Fetch Open Graph Protocol (OGP) metadata from the given link (head only)."""
+    try:
+        return fetch_ogp(session or new_session(), link, timeout=LNQ_ENRICH_TIMEOUT)
+    except requests.RequestException as e:
+        logging.error(f"Error fetching OGP data: {e}")
+        return {}
+
+
+def image_url(data):
+    """URL of the og:image of an OGP dict, or None."""
+    for entry in (data or {}).get("open_graph", []):
+        if isinstance(entry, dict) and entry.get("name") == "image" and entry.get("value"):
+            return entry["value"]
+    return None
+
+
+# Rendered sizes: variant, width, banner height, banner font size
+SIZES = (("card", 400, 25, 20), ("detail", 800, 50, 40))
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+
+@functools.lru_cache(maxsize=8)
+def _font(size):
+    # Set the font path (make sure you have the font available)
+    return ImageFont.truetype("fonts/VictorMono-Bold.ttf", size)
+
+
+@functools.lru_cache(maxsize=256)
+def banner(banner_text, width, height, font_size):
+    """
+    Black strip with the source text, added below the image. It only depends
+    on the source and the size, so it is rendered once and reused.
+    Returns:
+        A read-only BGR array of shape (height, width, 3).
+    """
+    strip = Image.new("RGB", (width, height), (0, 0, 0))
+    draw = ImageDraw.Draw(strip)
+    font = _font(font_size)
+
+    # Position the text at the bottom-left corner of the black line
+    bbox = draw.textbbox((0, 0), banner_text, font=font)
+    text_height = bbox[3] - bbox[1]
+    padding = width // 80  # 10px left padding at 800px
+    padding_bottom = height * 2 // 5  # 20px at 800px
+    draw.text(
+        (padding, height - text_height - padding_bottom),
+        banner_text,
+        font=font,
+        fill=(255, 255, 255),  # White text
+    )
+    array = cv2.cvtColor(np.array(strip), cv2.COLOR_RGB2BGR)
+    array.flags.writeable = False
+    return array
+
+
+def render_variants(content, banner_text="© Image Source"):
+    """
+    Render the card and detail sizes of an image, with the source banner.
+    Returns:
+        {(variant, ext): bytes} with WebP and JPEG files, or None when the
+        image cannot be decoded.
+    """
+    # Convert image bytes to OpenCV format
+    image_array = np.frombuffer(content, np.uint8)
+    image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+
+    if image is None:
+        print("Error: Unable to decode image.")
+        return None
+
+    files = {}
+    for variant, width, banner_height, font_size in SIZES:
+        # Resize image to the variant width while maintaining aspect ratio
+        height = max(1, int((width / image.shape[1]) * image.shape[0]))
+        resized = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        framed = np.vstack((resized, banner(banner_text, width, banner_height, font_size)))
+        _, webp = cv2.imencode(".webp", framed, [cv2.IMWRITE_WEBP_QUALITY, WEBP_QUALITY])
+        _, jpeg = cv2.imencode(".jpg", framed, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        files[(variant, "webp")] = webp.tobytes()
+        files[(variant, "jpg")] = jpeg.tobytes()
+    return files
+
+
+class Enricher:
+    """
+    Runs the enrichment of articles in the background.
+    A fetch pool downloads the page metadata and the image (at most
+    LNQ_ENRICH_PER_HOST requests per host at a time), then hands the bytes
+    to the image pool, which renders the card and detail sizes, uploads them
+    to the image store and saves the article. An image already in the
+    store (same source URL and banner) is neither downloaded nor rendered.
+    """
+
+    def __init__(
+        self,
+        workers=LNQ_ENRICH_WORKERS,
+        image_workers=LNQ_ENRICH_IMAGE_WORKERS,
+        per_host=LNQ_ENRICH_PER_HOST,
+    ):
+        self.per_host = per_host
+        self.session = new_session(per_host)
+        self._fetch_pool = ThreadPoolExecutor(workers, thread_name_prefix="fetch")
+        self._image_pool = ThreadPoolExecutor(image_workers, thread_name_prefix="image")
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._in_flight = set()
+        # Digests of the images known to be stored (most recent last)
+        self._stored = OrderedDict()
+
+    def __contains__(self, uuid):
+        with self._lock:
+            return uuid in self._in_flight
+
+    def __len__(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    def submit(self, item):
+        """Queue an article; returns False if it is already being enriched."""
+        with self._lock:
+            if item.uuid in self._in_flight:
+                return False
+            self._in_flight.add(item.uuid)
+        self._fetch_pool.submit(self._fetch, item)
+        return True
+
+    def wait(self, below, poll=0.1):
+        """Block until fewer than `below` articles are in flight (backpressure)."""
+        while len(self) >= below:
+            time.sleep(poll)
+
+    def shutdown(self):
+        self._fetch_pool.shutdown(wait=True)
+        self._image_pool.shutdown(wait=True)
+
+    @contextmanager
+    def _host_slot(self, url):
+        host = urlsplit(url).hostname
+        with self._lock:
+            semaphore = self._hosts.setdefault(host, threading.BoundedSemaphore(self.per_host))
+        with semaphore:
+            yield
+
+    def _is_stored(self, digest):
+        with self._lock:
+            if digest in self._stored:
+                self._stored.move_to_end(digest)
+                return True
+        if utils.has_image(digest):
+            self._remember(digest)
+            return True
+        return False
+
+    def _remember(self, digest):
+        with self._lock:
+            self._stored[digest] = True
+            self._stored.move_to_end(digest)
+            while len(self._stored) > LNQ_ENRICH_KNOWN_IMAGES:
+                self._stored.popitem(last=False)
+
+    def _fetch(self, item):
+        digest = content = None
+        banner_text = "© " + item.source + " " + str(time.localtime().tm_year)
+        try:
+            logging.info(f"[{item.uuid}]: OGP")
+            try:
+                with self._host_slot(item.link):
+                    item.ogp = fetch_ogp(self.session, item.link, timeout=LNQ_ENRICH_TIMEOUT)
+            except requests.RequestException as e:
+                logging.error(f"Error fetching OGP data: {e}")
+                item.ogp = {}
+            url = image_url(item.ogp)
+            if url:
+                # Images shared by many articles (logos, wire photos) are
+                # downloaded and rendered once
+                digest = image_digest(url, banner_text)
+                if self._is_stored(digest):
+                    item.image = digest
+                    url = None
+            if url:
+                with self._host_slot(url):
+                    response = self.session.get(url, timeout=LNQ_ENRICH_TIMEOUT)
+                    response.raise_for_status()
+                    content = response.content
+        except Exception as e:
+            logging.error(f"[{item.uuid}]: Error fetching: {e}")
+        self._image_pool.submit(self._finish, item, digest, content, banner_text)
+
+    def _finish(self, item, digest, content, banner_text):
+        try:
+            if content is not None:
+                logging.info(f"[{item.uuid}]: Save image")
+                files = render_variants(content, banner_text)
+                # The row keeps the digest; the bytes go to the image store
+                if files and all(
+                    utils.put_image(digest, variant, ext, data)
+                    for (variant, ext), data in files.items()
+                ):
+                    self._remember(digest)
+                    item.image = digest
+        except Exception as e:
+            logging.error(f"[{item.uuid}]: Error rendering image: {e}")
+        try:
+            item.ner_count += 1
+            logging.info(f"[{item.uuid}]: Update")
+            item.update()
+        except Exception as e:
+            logging.error(f"[{item.uuid}]: Error to update: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(item.uuid)
+
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: worker-ner/inference.py
+Description: CamemBERT NER + embedding inference with a selectable CPU
+backend (LNQ_NER_BACKEND):
+    torch       fp32 PyTorch (reference)
+    torch-int8  PyTorch with dynamic int8 quantization of the Linear layers
+    onnx        ONNX Runtime, fp32 export of the model
+    onnx-int8   ONNX Runtime, dynamic int8 quantization of the export
+Every backend returns the token classification logits and the last hidden
+state of one forward pass; tokenization, batching and output formatting
+are shared so the results keep the same shape whatever the backend.
+"""
+
+import os
+import logging
+
+import numpy as np
+import torch
+from transformers import AutoModelForTokenClassification, CamembertTokenizer
+
+LNQ_NER_MODEL = os.getenv("LNQ_NER_MODEL", "Jean-Baptiste/camembert-ner")
+LNQ_NER_BACKEND = os.getenv("LNQ_NER_BACKEND", "torch")
+LNQ_NER_ONNX_DIR = os.getenv(
+    "LNQ_NER_ONNX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx")
+)
+LNQ_NER_BATCH_SIZE = int(os.getenv("LNQ_NER_BATCH_SIZE", "16"))
+LNQ_NER_MAX_LENGTH = int(os.getenv("LNQ_NER_MAX_LENGTH", "512"))
+LNQ_NER_THREADS = int(os.getenv("OMP_NUM_THREADS", "1"))
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+
+class _Outputs(torch.nn.Module):
+    """Model wrapper returning (logits, last hidden state), used for the ONNX export."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        outputs = self.model(
+            input_ids=input_ids, attention_mask=attention_mask, output_hidden_states=True
+        )
+        return outputs.logits, outputs.hidden_states[-1]
+
+
+class TorchBackend:
+
+    def __init__(self, model, quantize=False):
+        model = model.to("cpu").eval()
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.model = model
+
+    def __call__(self, input_ids, attention_mask):
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=torch.from_numpy(input_ids),
+                attention_mask=torch.from_numpy(attention_mask),
+                output_hidden_states=True,
+            )
+        return outputs.logits.numpy(), outputs.hidden_states[-1].numpy()
+
+
+class OnnxBackend:
+
+    def __init__(self, model, quantize=False, directory=LNQ_NER_ONNX_DIR):
+        import onnxruntime
+
+        path = export_onnx(model, directory)
+        if quantize:
+            path = quantize_onnx(path)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = LNQ_NER_THREADS
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+
+    def __call__(self, input_ids, attention_mask):
+        logits, hidden_state = self.session.run(
+            ["logits", "last_hidden_state"],
+            {"input_ids": input_ids, "attention_mask": attention_mask},
+        )
+        return logits, hidden_state
+
+
+def export_onnx(model, directory=LNQ_NER_ONNX_DIR):
+    """Export the model to ONNX once; returns the path of the .onnx file."""
+    path = os.path.join(directory, "model.onnx")
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    logging.info(f"Exporting {LNQ_NER_MODEL} to {path}")
+    dummy = torch.ones((1, 8), dtype=torch.long)
+    torch.onnx.export(
+        _Outputs(model.to("cpu").eval()),
+        (dummy, dummy),
+        path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits", "last_hidden_state"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch", 1: "sequence"},
+            "last_hidden_state": {0: "batch", 1: "sequence"},
+        },
+        opset_version=14,
+    )
+    return path
+
+
+def quantize_onnx(path):
+    """Dynamic int8 quantization of an exported model; returns the new path."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized = path.replace(".onnx", ".int8.onnx")
+    if not os.path.exists(quantized):
+        logging.info(f"Quantizing {path} to {quantized}")
+        quantize_dynamic(path, quantized, weight_type=QuantType.QInt8)
+    return quantized
+
+
+class NerEmbedder:
+    """Tokenizer + backend: texts in, (formatted_results, embedding) out."""
+
+    def __init__(self, backend=LNQ_NER_BACKEND, model_name=LNQ_NER_MODEL):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown NER backend {backend!r}, use one of {BACKENDS}")
+        self.name = backend
+        self.tokenizer = CamembertTokenizer.from_pretrained(model_name)
+        model = AutoModelForTokenClassification.from_pretrained(model_name)
+        self.id2label = model.config.id2label
+        # Identifies the outputs (see cache.py): model, revision and backend
+        revision = getattr(model.config, "_commit_hash", None) or "local"
+        self.version = f"{model_name}@{revision}/{backend}"
+        if backend.startswith("onnx"):
+            self.backend = OnnxBackend(model, quantize=backend.endswith("int8"))
+        else:
+            self.backend = TorchBackend(model, quantize=backend.endswith("int8"))
+        logging.info(f"NER backend: {backend}")
+
+    def _tags(self, input_ids, special_tokens_mask, labels):
+        # Same output as the "ner" pipeline: O and special tokens are skipped
+        tokens = self.tokenizer.convert_ids_to_tokens(input_ids)
+        tags = []
+        for token, special, label in zip(tokens, special_tokens_mask, labels):
+            label = self.id2label[int(label)]
+            if special or label == "O":
+                continue
+            tags.append({"entity": token.lstrip("▁"), "label": label})
+        return tags
+
+    def __call__(self, texts, batch_size=None):
+        """
+        Get NER tags and embeddings for many texts.
+        Texts are sorted by token length and padded per batch, and each batch
+        runs a single forward pass: the token classification logits give the
+        NER tags and the last hidden state, averaged over the real tokens,
+        gives the embedding.
+        Args:
+            texts: The texts to process.
+            batch_size: Number of texts per forward pass (LNQ_NER_BATCH_SIZE).
+
+        Returns:
+            One (formatted_results, embedding) pair per text, in input order.
+        """
+        batch_size = batch_size or LNQ_NER_BATCH_SIZE
+        encodings = self.tokenizer(
+            list(texts),
+            truncation=True,
+            max_length=LNQ_NER_MAX_LENGTH,
+            return_special_tokens_mask=True,
+        )
+        input_ids = encodings["input_ids"]
+        # Length bucketing: neighbours in this order need little padding
+        order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]))
+        results = [None] * len(input_ids)
+
+        for start in range(0, len(order), batch_size):
+            batch = order[start : start + batch_size]
+            inputs = self.tokenizer.pad(
+                [
+                    {"input_ids": input_ids[i], "attention_mask": encodings["attention_mask"][i]}
+                    for i in batch
+                ],
+                return_tensors="np",
+            )
+            ids = inputs["input_ids"].astype(np.int64)
+            attention_mask = inputs["attention_mask"].astype(np.int64)
+            logits, last_hidden_state = self.backend(ids, attention_mask)
+
+            # Mean over the real tokens only (padding is masked out)
+            mask = attention_mask[..., None].astype(last_hidden_state.dtype)
+            embeddings = (last_hidden_state * mask).sum(axis=1) / mask.sum(axis=1)
+            labels = logits.argmax(axis=-1)
+
+            for line, i in enumerate(batch):
+                length = len(input_ids[i])
+                tags = self._tags(
+                    input_ids[i],
+                    encodings["special_tokens_mask"][i],
+                    labels[line, :length],
+                )
+                results[i] = (tags, embeddings[line].astype(np.float32).tolist())
+        return results
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module Name: worker-ner/ogp.py
+Description: Open Graph metadata of an article page. The page is streamed
+and parsed incrementally until </head> (or LNQ_OGP_MAX_BYTES), then the
+connection is closed: the body of the article is never downloaded. The
+meta tags are grouped like meta_tags_parser did, so the `ogp` dict keeps
+its shape: {"title", "basic", "open_graph", "twitter", "other"}, each
+group a list of {"name", "value"} with the og: / twitter: prefix removed.
+Pages served without a charset are decoded with the one declared in their
+<meta> tags, as browsers do (many sites still use windows-1252).
+"""
+
+import codecs
+import logging
+import os
+import re
+from html.parser import HTMLParser
+
+import requests
+
+LNQ_OGP_MAX_BYTES = int(os.getenv("LNQ_OGP_MAX_BYTES", str(256 * 1024)))
+CHUNK_SIZE = 16 * 1024
+# Bytes searched for a <meta charset> when the response has no charset
+CHARSET_PRESCAN_BYTES = 4096
+# <meta charset="..."> and <meta http-equiv="Content-Type" content="...; charset=...">
+META_CHARSET_RE = re.compile(rb"""<meta[^>]*?charset\s*=\s*["']?\s*([a-z0-9_.:-]+)""", re.I)
+BOMS = ((codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+# Labels that browsers decode as windows-1252 (its printable range is a superset)
+WINDOWS_1252 = ("iso-8859-1", "iso8859-1", "latin1", "latin-1", "us-ascii", "ascii")
+
+BASIC_META_TAGS = ("title", "description", "keywords", "robots", "viewport")
+
+
+class MetaTagParser(HTMLParser):
+    """Collects <title> and the <meta> tags of the <head>."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.meta = []
+        self.done = False
+        self._in_title = False
+        self._title = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            self.meta.append(
+                {name.lower().strip(): value or "" for name, value in attrs if name}
+            )
+        elif tag == "title" and self.title is None:
+            self._in_title = True
+        elif tag == "body":
+            self.done = True
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title).strip()
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title.append(data)
+
+    def result(self):
+        """The meta tags grouped as an OGP dict."""
+        ogp = {
+            "title": self.title or "".join(self._title).strip(),
+            "basic": [],
+            "open_graph": [],
+            "twitter": [],
+            "other": [],
+        }
+        for attrs in self.meta:
+            content = attrs.get("content")
+            if not content:
+                continue
+            name = attrs.get("name", "").lower().strip()
+            prop = attrs.get("property", "").lower().strip()
+            if prop.startswith("og:"):
+                ogp["open_graph"].append({"name": prop[3:], "value": content})
+            elif name.startswith("twitter:") or prop.startswith("twitter:"):
+                key = name if name.startswith("twitter:") else prop
+                ogp["twitter"].append({"name": key[8:], "value": content})
+            elif name in BASIC_META_TAGS:
+                ogp["basic"].append({"name": name, "value": content})
+            elif name:
+                ogp["other"].append({"name": name, "value": content})
+        return ogp
+
+
+def parse_ogp(html):
+    """Extract the meta tags of an HTML document (or of its head) as an OGP dict."""
+    parser = MetaTagParser()
+    parser.feed(html)
+    parser.close()
+    return parser.result()
+
+
+def sniff_charset(head):
+    """
+    Charset of a page from its first bytes: byte order mark, then <meta>
+    declaration, then utf-8 if the bytes decode as such, else windows-1252.
+    """
+    for bom, charset in BOMS:
+        if head.startswith(bom):
+            return charset
+    match = META_CHARSET_RE.search(head)
+    if match:
+        return match.group(1).decode("ascii").lower()
+    try:
+        # A multi-byte character cut at the end of the buffer is not an error
+        codecs.getincrementaldecoder("utf-8")().decode(head)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "windows-1252"
+
+
+def incremental_decoder(charset):
+    """Incremental decoder of a charset label (utf-8 when unknown)."""
+    charset = (charset or "utf-8").lower()
+    if charset in WINDOWS_1252:
+        charset = "windows-1252"
+    try:
+        return codecs.getincrementaldecoder(charset)(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+def fetch_ogp(session, url, max_bytes=LNQ_OGP_MAX_BYTES, timeout=15):
+    """
+    Stream the head of a page and extract its meta tags.
+    Args:
+        session: A requests.Session (or the requests module).
+        url: The article link.
+        max_bytes: Stop reading after this many bytes if </head> was not seen.
+        timeout: Connect / read timeout in seconds.
+
+    Returns:
+        The OGP dict. Raises requests.RequestException on HTTP errors.
+    """
+    parser = MetaTagParser()
+    with session.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        # requests falls back to ISO-8859-1 for text/html without charset,
+        # so only a charset sent in the header is trusted
+        content_type = response.headers.get("Content-Type", "").lower()
+        charset = response.encoding if "charset" in content_type else None
+        chunks = response.iter_content(CHUNK_SIZE)
+        head = b""
+        if charset is None:
+            # Buffer the start of the page to find its <meta> charset
+            for chunk in chunks:
+                head += chunk
+                if len(head) >= CHARSET_PRESCAN_BYTES:
+                    break
+            charset = sniff_charset(head[:CHARSET_PRESCAN_BYTES])
+        decoder = incremental_decoder(charset)
+        parser.feed(decoder.decode(head))
+        read = len(head)
+        if not parser.done and read < max_bytes:
+            for chunk in chunks:
+                parser.feed(decoder.decode(chunk))
+                read += len(chunk)
+                if parser.done or read >= max_bytes:
+                    break
+    logging.debug(f"OGP: read {read} bytes of {url}")
+    return parser.result()